@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the music library backend.
+
+Every benchmark runs against a throwaway database in a temporary
+directory, so the real library is never touched.
+
+    python benchmark.py connections --songs 50000 --lookups 20000
+    python benchmark.py playlists --sizes 10 1000 100000
+    python benchmark.py scan --files 2000 --workers 1 2 4 8
+    python benchmark.py playback --seconds 30 --format flac
+"""
+import sys
+import os
+import argparse
+import random
+import sqlite3
+import struct
+import tempfile
+import time
+import wave
+from array import array
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from database import Database
+
+
+def _timed(func, *args):
+    """Run func and return (elapsed seconds, result)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def _populate_songs(db, count):
+    """Fill the songs table with synthetic rows"""
+    with db.get_connection() as conn:
+        conn.executemany('''
+            INSERT INTO songs (title, artist, album, duration, filepath)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            (f"Song {i:06d}", f"Artist {i % 500}", f"Album {i % 2000}",
+             180 + i % 120, f"/music/{i:06d}.mp3")
+            for i in range(count)
+        ))
+
+
+def bench_connections(args):
+    """Compare a fresh connection per call against the pooled connection"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / "bench.db")
+        _populate_songs(db, args.songs)
+        song_ids = [random.randint(1, args.songs) for _ in range(args.lookups)]
+
+        def per_call():
+            for song_id in song_ids:
+                conn = sqlite3.connect(db.db_path)
+                conn.row_factory = sqlite3.Row
+                conn.execute('SELECT * FROM songs WHERE id = ?', (song_id,)).fetchone()
+                conn.close()
+
+        def pooled():
+            for song_id in song_ids:
+                db.get_song(song_id)
+
+        per_call_time, _ = _timed(per_call)
+        pooled_time, _ = _timed(pooled)
+        db.close()
+
+    print(f"{args.lookups} lookups over {args.songs} songs")
+    print(f"  per-call connections: {per_call_time:8.3f}s "
+          f"({per_call_time / args.lookups * 1e6:7.1f} us/lookup)")
+    print(f"  pooled connection:    {pooled_time:8.3f}s "
+          f"({pooled_time / args.lookups * 1e6:7.1f} us/lookup)")
+    print(f"  speedup: {per_call_time / pooled_time:.1f}x")
+
+
+def bench_playlists(args):
+    """Time append, move and remove on playlists of increasing size"""
+    print(f"{'size':>8} {'op':>7} {'us/op':>10} {'rows/op':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(Path(tmp) / "bench.db")
+            _populate_songs(db, size + args.ops)
+            playlist_id = db.create_playlist("Benchmark")
+            with db.get_connection() as conn:
+                conn.executemany('''
+                    INSERT INTO playlist_songs (playlist_id, song_id, position)
+                    VALUES (?, ?, ?)
+                ''', ((playlist_id, song_id, song_id * Config.PLAYLIST_POSITION_GAP)
+                      for song_id in range(1, size + 1)))
+            conn = db.get_connection()
+
+            extra_ids = range(size + 1, size + args.ops + 1)
+            moves = [(random.randint(1, size), random.randint(1, size))
+                     for _ in range(args.ops)]
+            removals = random.sample(range(1, size + 1), min(args.ops, size))
+
+            operations = [
+                ('append', lambda: [db.add_song_to_playlist(playlist_id, song_id)
+                                    for song_id in extra_ids]),
+                ('move', lambda: [db.reorder_playlist_song(playlist_id, song_id, index)
+                                  for song_id, index in moves]),
+                ('remove', lambda: [db.remove_song_from_playlist(playlist_id, song_id)
+                                    for song_id in removals]),
+            ]
+            for name, operation in operations:
+                changes = conn.total_changes
+                elapsed, results = _timed(operation)
+                count = len(results)
+                print(f"{size:>8} {name:>7} {elapsed / count * 1e6:>10.1f} "
+                      f"{(conn.total_changes - changes) / count:>8.1f}")
+            db.close()
+
+
+def _synthetic_mp3(title, artist, album, frames):
+    """Build a small but valid MP3: an ID3v2.3 tag and silent MPEG frames"""
+    def text_frame(frame_id, text):
+        data = b'\x00' + text.encode('latin-1')
+        return frame_id + struct.pack('>I', len(data)) + b'\x00\x00' + data
+
+    body = text_frame(b'TIT2', title) + text_frame(b'TPE1', artist) + text_frame(b'TALB', album)
+    size = bytes((len(body) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    tag = b'ID3\x03\x00\x00' + size + body
+
+    # MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417 byte frames
+    frame = b'\xff\xfb\x90\x64' + bytes(413)
+    return tag + frame * frames
+
+
+def bench_scan(args):
+    """Time a cold library scan of a synthetic tree per worker count"""
+    from modules.file_manager import FileManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "library"
+        for i in range(args.files):
+            directory = root / f"Artist {i % 50}" / f"Album {i % 200}"
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"{i:06d}.mp3").write_bytes(
+                _synthetic_mp3(f"Song {i}", f"Artist {i % 50}", f"Album {i % 200}", args.frames)
+            )
+
+        print(f"{args.files} files, {args.frames} frames each")
+        baseline = None
+        for workers in args.workers:
+            db = Database(Path(tmp) / f"bench_{workers}.db")
+            file_manager = FileManager(db)
+            file_manager.downloads_dir = root
+            elapsed, stats = _timed(file_manager.scan_library, None, workers)
+            db.close()
+
+            baseline = baseline or elapsed
+            print(f"  {workers:>3} workers: {elapsed:8.3f}s "
+                  f"({stats['seen'] / elapsed:8.0f} files/s, {baseline / elapsed:.1f}x)")
+
+
+def _timecode_wav(path, seconds):
+    """Write a 44.1 kHz 16-bit stereo WAV whose every frame holds its own number
+
+    Frame i carries i + 1 split over the two channels (high bits left, low
+    15 bits right), so any rendered frame tells which point of the track
+    it came from, and silence reads as 0.
+    """
+    frames = int(seconds * 44100)
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(44100)
+        for start in range(0, frames, 44100):
+            chunk = array('h')
+            for number in range(start + 1, min(start + 44100, frames) + 1):
+                chunk.append(number >> 15)
+                chunk.append(number & 0x7FFF)
+            if sys.byteorder == 'big':
+                chunk.byteswap()
+            wav.writeframes(chunk.tobytes())
+    return frames
+
+
+def _crc_table(poly, width):
+    """Byte-wise lookup table for the MSB-first CRC of the given width"""
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for byte in range(256):
+        crc = byte << (width - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & mask if crc & top else (crc << 1) & mask
+        table.append(crc)
+    return table
+
+
+_FLAC_CRC8 = _crc_table(0x07, 8)
+_FLAC_CRC16 = _crc_table(0x8005, 16)
+
+
+def _crc(table, width, data):
+    """CRC of data with a table from _crc_table"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & ((1 << width) - 1)) ^ table[(crc >> (width - 8)) ^ byte]
+    return crc
+
+
+def _flac_subframe(samples):
+    """Bits of a FIXED order-2 FLAC subframe with one Rice partition"""
+    folded = []
+    for i in range(2, len(samples)):
+        residual = samples[i] - 2 * samples[i - 1] + samples[i - 2]
+        folded.append(2 * residual if residual >= 0 else -2 * residual - 1)
+    k = min(max(sum(folded) // max(len(folded), 1), 1).bit_length() - 1, 14)
+    bits = ['0001010' + '0', ''.join(format(s & 0xFFFF, '016b') for s in samples[:2])]
+    bits.append('00' + '0000' + format(k, '04b'))
+    low = (1 << k) - 1
+    for value in folded:
+        bits.append('0' * (value >> k) + '1' + (format(value & low, f'0{k}b') if k else ''))
+    return ''.join(bits)
+
+
+def _timecode_flac(path, seconds):
+    """Write the _timecode_wav frames as a FLAC file"""
+    frames = int(seconds * 44100)
+    block = 4096
+    out = bytearray(b'fLaC')
+    streaminfo = struct.pack('>HH', block, block) + bytes(6)
+    streaminfo += ((44100 << 44) | (1 << 41) | (15 << 36) | frames).to_bytes(8, 'big') + bytes(16)
+    out += b'\x80' + len(streaminfo).to_bytes(3, 'big') + streaminfo
+    for index, start in enumerate(range(0, frames, block)):
+        numbers = range(start + 1, min(start + block, frames) + 1)
+        # Fixed blocking, size in 16 bits after the frame number, 44.1 kHz,
+        # independent stereo, 16 bits
+        header = bytes([0xFF, 0xF8, 0x79, 0x18])
+        if index < 0x80:
+            header += bytes([index])
+        else:
+            header += bytes([0xC0 | index >> 6, 0x80 | index & 0x3F])
+        header += struct.pack('>H', len(numbers) - 1)
+        header += bytes([_crc(_FLAC_CRC8, 8, header)])
+        bits = _flac_subframe([n >> 15 for n in numbers]) + _flac_subframe([n & 0x7FFF for n in numbers])
+        bits += '0' * (-len(bits) % 8)
+        frame = header + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+        out += frame + struct.pack('>H', _crc(_FLAC_CRC16, 16, frame))
+    path.write_bytes(out)
+    return frames
+
+
+def _measure_playback(player, song_id, seconds, rendered):
+    """Play song_id with seeks and a pause, comparing get_position to the rendered frames
+
+    Returns (errors, latencies): per buffer rendered once the last seek or
+    resume was heard, (seconds since it was heard, reported - rendered),
+    and per seek or resume, the seconds until it was heard.
+    """
+    # Full volume leaves the samples, and so the frame numbers, untouched
+    player.set_volume(100)
+    player.load_song(song_id)
+
+    # One second after each other: seek, seek, pause for a second, seek
+    events = [('seek', 0.5), ('seek', 0.25), ('pause', None), ('seek', 0.75)]
+    errors = []
+    latencies = []
+    pending = None
+    output = open(rendered, 'rb')
+    size = os.path.getsize(rendered)
+    player.play()
+    heard = time.perf_counter()
+    next_event = heard + 1.0
+    while player.is_playing:
+        now = time.perf_counter()
+        if events and now >= next_event:
+            kind, fraction = events.pop(0)
+            if kind == 'pause':
+                player.pause()
+                time.sleep(1.0)
+                player.play()
+            else:
+                player.set_position(seconds * fraction)
+            # Held until the buffer carrying it starts playing
+            target = player.get_position()
+            pending = time.perf_counter()
+            next_event = pending + 1.0
+
+        grown = os.path.getsize(rendered)
+        if grown == size:
+            time.sleep(0.001)
+            continue
+        # A buffer was just written: it starts playing now
+        position = player.get_position()
+        block = grown - size
+        size = grown
+        output.seek(size - block)
+        high, low = struct.unpack('<hh', output.read(4))
+        number = (high << 15) | low
+        if not number:
+            continue
+        track_position = (number - 1) / 44100
+        if pending and abs(track_position - target) < 0.2:
+            heard = time.perf_counter()
+            latencies.append(heard - pending)
+            pending = None
+        if not pending:
+            errors.append((time.perf_counter() - heard, position - track_position))
+
+    output.close()
+    return errors, latencies
+
+
+def bench_playback(args):
+    """Check the player's position against the frames SDL actually renders"""
+    import pygame
+    from modules.player import MusicPlayer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # SDL's disk driver writes every rendered buffer to a file in real
+        # time, so the file's length is the device clock and its last buffer
+        # is what is playing right now
+        rendered = Path(tmp) / "rendered.raw"
+        os.environ['SDL_AUDIODRIVER'] = 'disk'
+        os.environ['SDL_DISKAUDIOFILE'] = str(rendered)
+        path = Path(tmp) / f"track.{args.format}"
+        write = _timecode_flac if args.format == 'flac' else _timecode_wav
+        frames = write(path, args.seconds)
+        Config.STATS_JOURNAL_PATH = Path(tmp) / "play_stats.journal"
+
+        db = Database(Path(tmp) / "bench.db")
+        song_id = db.add_song("Drift", "Benchmark", str(path), duration=frames / 44100)
+        player = MusicPlayer(db)
+        errors, latencies = _measure_playback(player, song_id, args.seconds, rendered)
+        pygame.mixer.quit()
+        player.stats.close()
+        db.close()
+
+    settled = [abs(error) for since, error in errors if since >= 0.2]
+    fresh = [abs(error) for since, error in errors if since < 0.2]
+    worst = max(settled + fresh)
+    print(f"{args.seconds}s {args.format} track, 3 seeks and a 1s pause, {len(errors)} buffers rendered")
+    print(f"  position - rendered:  {max(settled) * 1000:6.1f} ms worst once settled")
+    print(f"  first 200 ms after:   {max(fresh) * 1000:6.1f} ms worst (seek or resume)")
+    print(f"  seek/resume heard in: {max(latencies) * 1000:6.1f} ms worst")
+    print(f"  worst overall:        {worst * 1000:6.1f} ms (target 50 ms)")
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    connections = subparsers.add_parser('connections', help=bench_connections.__doc__)
+    connections.add_argument('--songs', type=int, default=50000)
+    connections.add_argument('--lookups', type=int, default=20000)
+    connections.set_defaults(func=bench_connections)
+
+    playlists = subparsers.add_parser('playlists', help=bench_playlists.__doc__)
+    playlists.add_argument('--sizes', type=int, nargs='+',
+                           default=[10, 100, 1000, 10000, 100000])
+    playlists.add_argument('--ops', type=int, default=200)
+    playlists.set_defaults(func=bench_playlists)
+
+    scan = subparsers.add_parser('scan', help=bench_scan.__doc__)
+    scan.add_argument('--files', type=int, default=2000)
+    scan.add_argument('--frames', type=int, default=40)
+    scan.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    scan.set_defaults(func=bench_scan)
+
+    playback = subparsers.add_parser('playback', help=bench_playback.__doc__)
+    playback.add_argument('--seconds', type=float, default=30)
+    playback.add_argument('--format', choices=['wav', 'flac'], default='wav')
+    playback.set_defaults(func=bench_playback)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,42 @@ class Config:
     # Player Settings
     DEFAULT_VOLUME = 70
     SUPPORTED_FORMATS = ['.mp3', '.wav', '.flac', '.m4a', '.ogg']
-    
+    QUEUE_HISTORY_SIZE = 1000  # Played songs remembered for Previous
+    SHUFFLE_SEED = 1  # Same seed and songs, same shuffled order across restarts
+
+    # Database Settings
+    DB_JOURNAL_MODE = "WAL"
+    DB_SYNCHRONOUS = "NORMAL"
+    DB_CACHE_SIZE_KB = 16384  # Page cache per connection
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the file to memory-map
+    DB_TEMP_STORE = "MEMORY"
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_BATCH_SIZE = 500  # Rows written per transaction by bulk operations
+    DB_PAGE_SIZE = 200  # Rows fetched per page by keyset pagination
+    PLAYLIST_POSITION_GAP = 1024  # Spacing between playlist positions
+
+    # Library scanning
+    SCAN_WORKERS = os.cpu_count() or 1  # Tag readers; 1 reads in-process
+    SCAN_EXECUTOR = "process"  # "process" or "thread"
+    SCAN_CHUNK_SIZE = 32  # Files handed to a worker at a time
+    SCAN_PROGRESS_INTERVAL = 0.25  # Seconds between scan progress snapshots
+    HASH_BLOCK_SIZE = 64 * 1024  # Bytes hashed at each end for duplicate detection
+    LIBRARY_DIRS = [DOWNLOADS_DIR]  # Roots watched for changes
+    WATCH_LIBRARY = True  # Watch library roots instead of rescanning on demand
+    WATCH_DEBOUNCE_MS = 1000  # Quiet time before queued changes are applied
+
+    # Tag editing
+    TAG_WRITE_WORKERS = 8  # Files retagged in parallel by bulk edits
+
+    # Library organizing
+    ORGANIZE_JOURNAL_PATH = BASE_DIR / "organize.journal"
+    ORGANIZE_COPY_WORKERS = 4  # Parallel copies when moving across devices
+
+    # Play statistics
+    STATS_JOURNAL_PATH = BASE_DIR / "play_stats.journal"
+    STATS_FLUSH_INTERVAL = 30  # Seconds between background flushes
+    STATS_FLUSH_THRESHOLD = 50  # Pending plays that trigger an early flush
+
     @classmethod
     def get_stylesheet(cls):
         return f"""
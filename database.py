@@ -1,4 +1,9 @@
+import os
+import re
 import sqlite3
+import threading
+from array import array
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 from config import Config
@@ -8,81 +13,598 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self):
-        self.db_path = Config.DATABASE_PATH
+    # Columns the keyset pagination API can order by
+    SONG_SORT_COLUMNS = ('title', 'artist', 'album', 'duration', 'play_count', 'added_date')
+    
+    # Columns the song list needs, all covered by idx_songs_listing
+    SONG_LIST_COLUMNS = 'title, id, artist, album, duration, play_count, added_date'
+    # Songs a prune pass flagged as missing, left out wherever songs are listed or queued
+    MISSING_SONG_IDS = 'SELECT id FROM songs WHERE missing = 1'
+    
+    # Schema migrations, applied in order; PRAGMA user_version is the
+    # number of migrations already applied
+    MIGRATIONS = (
+        '_migrate_base_schema',
+        '_migrate_search_index',
+        '_migrate_hot_query_indexes',
+        '_migrate_playlist_count_triggers',
+        '_migrate_file_fingerprints',
+        '_migrate_content_hashes',
+        '_migrate_missing_flag',
+        '_migrate_probe_cache',
+        '_migrate_missing_index',
+    )
+    
+    # Per migration version: (sql, args, index the plan must use)
+    QUERY_PLANS = {
+        1: [
+            ('SELECT * FROM songs WHERE id = ?', (1,), 'INTEGER PRIMARY KEY'),
+            ('SELECT song_id FROM playlist_songs WHERE playlist_id = ? ORDER BY position',
+             (1,), 'idx_playlist_songs'),
+        ],
+        2: [
+            ("SELECT rowid FROM songs_fts WHERE songs_fts MATCH ?", ('"a"*',),
+             'VIRTUAL TABLE INDEX'),
+        ],
+        3: [
+            ('SELECT {columns} FROM songs WHERE (title, id) > (?, ?) '
+             'ORDER BY title, id LIMIT 200', ('', 0), 'COVERING INDEX idx_songs_listing'),
+            ('SELECT id FROM songs WHERE filepath = ?', ('',), 'COVERING INDEX sqlite_autoindex_songs_1'),
+            ('SELECT * FROM songs WHERE play_count > 0 ORDER BY play_count DESC, id LIMIT 50',
+             (), 'idx_songs_most_played'),
+            ('SELECT * FROM songs ORDER BY added_date DESC, id DESC LIMIT 50',
+             (), 'idx_songs_added'),
+            ('DELETE FROM playlist_songs WHERE song_id = ?', (1,), 'idx_playlist_songs_song'),
+        ],
+        5: [
+            ('SELECT filepath, id, filesize, mtime_ns, inode FROM songs', (),
+             'COVERING INDEX idx_songs_fingerprint'),
+        ],
+        6: [
+            ('SELECT filesize, partial_hash FROM songs WHERE partial_hash IS NOT NULL '
+             'GROUP BY filesize, partial_hash HAVING COUNT(*) > 1', (),
+             'COVERING INDEX idx_songs_duplicates'),
+        ],
+        8: [
+            ('SELECT * FROM file_probes WHERE filepath = ? AND filesize = ? AND mtime_ns = ?',
+             ('', 0, 0), 'PRIMARY KEY'),
+        ],
+        9: [
+            ('{missing}', (), 'INDEX idx_songs_missing'),
+            ('SELECT {columns} FROM songs WHERE id NOT IN ({missing}) AND (title, id) > (?, ?) '
+             'ORDER BY title, id LIMIT 200', ('', 0), 'COVERING INDEX idx_songs_listing'),
+        ],
+    }
+    
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self._local = threading.local()
+        self._connections = []
+        self._pool_lock = threading.Lock()
         self.init_database()
     
-    def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
+    def _open_connection(self):
+        """Open a new connection with the tuned pragmas applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000.0,
+            check_same_thread=False
+        )
         conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA journal_mode = {Config.DB_JOURNAL_MODE}')
+        conn.execute(f'PRAGMA synchronous = {Config.DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = -{int(Config.DB_CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA temp_store = {Config.DB_TEMP_STORE}')
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+    
+    def get_connection(self):
+        """Get the pooled database connection for the calling thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._pool_lock:
+                self._connections.append(conn)
         return conn
     
+    def close(self):
+        """Close every pooled connection"""
+        with self._pool_lock:
+            connections, self._connections = self._connections, []
+        
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to close database connection: {e}")
+        
+        self._local = threading.local()
+    
     def init_database(self):
-        """Initialize database tables"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Songs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS songs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    artist TEXT DEFAULT 'Unknown',
-                    album TEXT DEFAULT '',
-                    duration INTEGER DEFAULT 0,
-                    filepath TEXT UNIQUE NOT NULL,
-                    filesize INTEGER DEFAULT 0,
-                    bitrate INTEGER DEFAULT 0,
-                    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_played TIMESTAMP,
-                    play_count INTEGER DEFAULT 0
-                )
-            ''')
+        """Initialize database tables and apply pending migrations"""
+        conn = self.get_connection()
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        for version, name in enumerate(self.MIGRATIONS, 1):
+            if version <= current:
+                continue
             
-            # Playlists table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS playlists (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    song_count INTEGER DEFAULT 0
-                )
-            ''')
+            migration = getattr(self, name)
+            logger.info(f"Migrating database to version {version}: {migration.__doc__}")
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        cursor = conn.execute('''
+            SELECT 1 FROM sqlite_master 
+            WHERE type = 'table' AND name = 'songs_fts'
+        ''')
+        self.fts_enabled = cursor.fetchone() is not None
+    
+    def get_schema_version(self):
+        """Get the migration version the database is at"""
+        return self.get_connection().execute('PRAGMA user_version').fetchone()[0]
+    
+    def check_query_plans(self):
+        """Check that the hot queries use the indexes their migrations added
+        
+        Returns a list of (sql, expected, actual plan) for every query whose
+        plan does not mention the expected index.
+        """
+        failures = []
+        conn = self.get_connection()
+        
+        for version, plans in self.QUERY_PLANS.items():
+            if version > self.get_schema_version():
+                continue
+            if version == 2 and not self.fts_enabled:
+                continue
             
-            # Playlist songs junction table
+            for sql, args, expected in plans:
+                sql = sql.format(columns=self.SONG_LIST_COLUMNS, missing=self.MISSING_SONG_IDS)
+                rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', args).fetchall()
+                plan = '; '.join(row[3] for row in rows)
+                if expected not in plan:
+                    failures.append((sql, expected, plan))
+        
+        return failures
+    
+    def _migrate_base_schema(self, cursor):
+        """Create songs, playlists and playlist_songs tables"""
+        # Songs table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS songs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                artist TEXT DEFAULT 'Unknown',
+                album TEXT DEFAULT '',
+                duration INTEGER DEFAULT 0,
+                filepath TEXT UNIQUE NOT NULL,
+                filesize INTEGER DEFAULT 0,
+                bitrate INTEGER DEFAULT 0,
+                added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_played TIMESTAMP,
+                play_count INTEGER DEFAULT 0
+            )
+        ''')
+        
+        # Playlists table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS playlists (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                song_count INTEGER DEFAULT 0
+            )
+        ''')
+        
+        # Playlist songs junction table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS playlist_songs (
+                playlist_id INTEGER,
+                song_id INTEGER,
+                position INTEGER,
+                added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (playlist_id, song_id),
+                FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
+                FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Create indexes
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_title ON songs(title)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs(artist)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_songs ON playlist_songs(playlist_id, position)')
+    
+    def _migrate_search_index(self, cursor):
+        """Add the full-text search index"""
+        self._init_search_index(cursor)
+    
+    def _migrate_hot_query_indexes(self, cursor):
+        """Add covering and partial indexes for the hot queries"""
+        # Title-ordered listing, answered from the index alone
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_songs_listing 
+            ON songs(title, {self.SONG_LIST_COLUMNS.replace('title, ', '')})
+        ''')
+        # Superseded by idx_songs_listing, which has title as its prefix
+        cursor.execute('DROP INDEX IF EXISTS idx_songs_title')
+        
+        # Most played, only songs that have been played at all
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_songs_most_played 
+            ON songs(play_count DESC, id) WHERE play_count > 0
+        ''')
+        
+        # Recently added
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_songs_added 
+            ON songs(added_date DESC, id DESC)
+        ''')
+        
+        # Cascading deletes from songs into playlist_songs
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_playlist_songs_song 
+            ON playlist_songs(song_id)
+        ''')
+        
+        cursor.execute('ANALYZE')
+    
+    def _migrate_playlist_count_triggers(self, cursor):
+        """Keep playlists.song_count up to date with triggers"""
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS playlist_songs_count_insert 
+            AFTER INSERT ON playlist_songs BEGIN
+                UPDATE playlists SET song_count = song_count + 1 
+                WHERE id = new.playlist_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS playlist_songs_count_delete 
+            AFTER DELETE ON playlist_songs BEGIN
+                UPDATE playlists SET song_count = song_count - 1 
+                WHERE id = old.playlist_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS playlist_songs_count_move 
+            AFTER UPDATE OF playlist_id ON playlist_songs BEGIN
+                UPDATE playlists SET song_count = song_count - 1 
+                WHERE id = old.playlist_id;
+                UPDATE playlists SET song_count = song_count + 1 
+                WHERE id = new.playlist_id;
+            END
+        ''')
+        
+        # Start from correct counts
+        self.repair_playlist_counts(cursor)
+    
+    def _migrate_file_fingerprints(self, cursor):
+        """Store (size, mtime, inode) per song for incremental scans"""
+        cursor.execute('ALTER TABLE songs ADD COLUMN mtime_ns INTEGER DEFAULT 0')
+        cursor.execute('ALTER TABLE songs ADD COLUMN inode INTEGER DEFAULT 0')
+        
+        # Lets the scan load every fingerprint without reading whole rows
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_songs_fingerprint 
+            ON songs(filepath, filesize, mtime_ns, inode)
+        ''')
+    
+    def _migrate_content_hashes(self, cursor):
+        """Store partial and full content hashes for duplicate detection"""
+        cursor.execute('ALTER TABLE songs ADD COLUMN partial_hash TEXT')
+        cursor.execute('ALTER TABLE songs ADD COLUMN content_hash TEXT')
+        
+        # Duplicate candidates share a size and partial hash
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_songs_duplicates 
+            ON songs(filesize, partial_hash)
+        ''')
+    
+    def _migrate_missing_flag(self, cursor):
+        """Let a prune pass flag songs whose files are gone instead of deleting them"""
+        cursor.execute('ALTER TABLE songs ADD COLUMN missing INTEGER NOT NULL DEFAULT 0')
+    
+    def _migrate_probe_cache(self, cursor):
+        """Remember which files the player can open, keyed by (path, size, mtime)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_probes (
+                filepath TEXT PRIMARY KEY,
+                filesize INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                playable INTEGER NOT NULL,
+                codec TEXT,
+                duration REAL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        
+        # A probe outlives neither its song nor the song's path
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_probe_delete 
+            AFTER DELETE ON songs BEGIN
+                DELETE FROM file_probes WHERE filepath = old.filepath;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_probe_move 
+            AFTER UPDATE OF filepath ON songs BEGIN
+                DELETE FROM file_probes WHERE filepath = old.filepath;
+            END
+        ''')
+    
+    def _migrate_missing_index(self, cursor):
+        """Index the songs flagged missing so listings can leave them out"""
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_songs_missing 
+            ON songs(id) WHERE missing = 1
+        ''')
+    
+    
+    def _init_search_index(self, cursor):
+        """Create the FTS5 index over songs and the triggers that keep it in sync"""
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master 
+            WHERE type = 'table' AND name = 'songs_fts'
+        ''')
+        exists = cursor.fetchone() is not None
+        
+        try:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS playlist_songs (
-                    playlist_id INTEGER,
-                    song_id INTEGER,
-                    position INTEGER,
-                    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (playlist_id, song_id),
-                    FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
-                    FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+                CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                    title, artist, album,
+                    content='songs',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
                 )
             ''')
-            
-            # Create indexes
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_title ON songs(title)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs(artist)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_songs ON playlist_songs(playlist_id, position)')
-            
-            conn.commit()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+                INSERT INTO songs_fts (rowid, title, artist, album)
+                VALUES (new.id, new.title, new.artist, new.album);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, title, artist, album)
+                VALUES ('delete', old.id, old.title, old.artist, old.album);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_update 
+            AFTER UPDATE OF title, artist, album ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, title, artist, album)
+                VALUES ('delete', old.id, old.title, old.artist, old.album);
+                INSERT INTO songs_fts (rowid, title, artist, album)
+                VALUES (new.id, new.title, new.artist, new.album);
+            END
+        ''')
+        
+        if not exists:
+            # Backfill libraries created before the index existed
+            cursor.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+            logger.info("Built full-text search index")
+        
+        return True
+    
+    @staticmethod
+    def _build_match_query(query):
+        """Turn free text into an FTS5 prefix query, or None if it has no terms"""
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"*' for term in terms)
     
     # Song operations
     def add_song(self, title, artist, filepath, duration=0, album='', filesize=0, bitrate=0):
         """Add a song to database"""
+        self.add_songs([{
+            'title': title,
+            'artist': artist,
+            'filepath': filepath,
+            'duration': duration,
+            'album': album,
+            'filesize': filesize,
+            'bitrate': bitrate
+        }])
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO songs 
-                (title, artist, album, duration, filepath, filesize, bitrate)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (title, artist, album, duration, str(filepath), filesize, bitrate))
-            conn.commit()
-            return cursor.lastrowid
+            cursor.execute('SELECT id FROM songs WHERE filepath = ?', (str(filepath),))
+            result = cursor.fetchone()
+            return result[0] if result else None
+    
+    def add_songs(self, songs, batch_size=None):
+        """Insert or update many songs, committing once per batch
+        
+        songs is an iterable of dicts with the same keys as add_song's
+        arguments. Existing rows (matched on filepath) keep their id, play
+        count and playlist membership. Returns the number of rows written.
+        """
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        rows = (
+            (
+                song['title'],
+                song.get('artist', 'Unknown'),
+                song.get('album', ''),
+                song.get('duration', 0),
+                str(song['filepath']),
+                song.get('filesize', 0),
+                song.get('bitrate', 0),
+                song.get('mtime_ns', 0),
+                song.get('inode', 0),
+                song.get('partial_hash')
+            )
+            for song in songs
+        )
+        
+        written = 0
+        conn = self.get_connection()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            
+            with conn:
+                conn.executemany('''
+                    INSERT INTO songs 
+                    (title, artist, album, duration, filepath, filesize, bitrate,
+                     mtime_ns, inode, partial_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(filepath) DO UPDATE SET
+                        title = excluded.title,
+                        artist = excluded.artist,
+                        album = excluded.album,
+                        duration = excluded.duration,
+                        filesize = excluded.filesize,
+                        bitrate = excluded.bitrate,
+                        mtime_ns = excluded.mtime_ns,
+                        inode = excluded.inode,
+                        partial_hash = excluded.partial_hash,
+                        content_hash = NULL,
+                        missing = 0
+                ''', batch)
+            written += len(batch)
+        
+        return written
+    
+    def get_file_fingerprints(self, prefix=None):
+        """Get {filepath: (id, filesize, mtime_ns, inode)} for every song
+        
+        With prefix, only songs anywhere under that directory are returned,
+        using a range scan on the filepath index.
+        """
+        conn = self.get_connection()
+        if prefix is None:
+            cursor = conn.execute('''
+                SELECT filepath, id, filesize, mtime_ns, inode FROM songs
+            ''')
+        else:
+            # Every path below prefix sorts between "prefix/" and "prefix0"
+            prefix = str(prefix).rstrip(os.sep)
+            cursor = conn.execute('''
+                SELECT filepath, id, filesize, mtime_ns, inode FROM songs
+                WHERE filepath > ? AND filepath < ?
+            ''', (prefix + os.sep, prefix + chr(ord(os.sep) + 1)))
+        return {row[0]: tuple(row[1:]) for row in cursor}
+    
+    def get_song_ids(self, filepaths):
+        """Get {filepath: id} for the songs stored at filepaths"""
+        conn = self.get_connection()
+        ids = {}
+        for path in filepaths:
+            row = conn.execute('SELECT id FROM songs WHERE filepath = ?', (str(path),)).fetchone()
+            if row:
+                ids[str(path)] = row[0]
+        return ids
+    
+    def move_songs(self, moves, batch_size=None):
+        """Point songs at new files without touching their other data
+        
+        moves is an iterable of (song_id, filepath, filesize, mtime_ns, inode).
+        """
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        rows = ((str(path), size, mtime_ns, inode, song_id)
+                for song_id, path, size, mtime_ns, inode in moves)
+        
+        conn = self.get_connection()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany('''
+                    UPDATE songs 
+                    SET filepath = ?, filesize = ?, mtime_ns = ?, inode = ?, missing = 0 
+                    WHERE id = ?
+                ''', batch)
+    
+    def delete_songs(self, song_ids, batch_size=None):
+        """Delete many songs, committing once per batch"""
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        rows = ((song_id,) for song_id in song_ids)
+        
+        deleted = 0
+        conn = self.get_connection()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany('DELETE FROM songs WHERE id = ?', batch)
+            deleted += len(batch)
+        
+        return deleted
+    
+    def get_missing_song_ids(self):
+        """Get the ids of songs flagged as missing"""
+        return {row[0] for row in self.get_connection().execute(self.MISSING_SONG_IDS)}
+    
+    def mark_missing_songs(self, song_ids, found_ids=()):
+        """Flag song_ids as missing and clear the flag on found_ids, in one transaction"""
+        with self.get_connection() as conn:
+            conn.executemany(
+                'UPDATE songs SET missing = 0 WHERE id = ?',
+                ((song_id,) for song_id in found_ids)
+            )
+            conn.executemany(
+                'UPDATE songs SET missing = 1 WHERE id = ?',
+                ((song_id,) for song_id in song_ids)
+            )
+    
+    def get_unhashed_songs(self):
+        """Get (id, filepath) for songs that have no partial hash yet"""
+        conn = self.get_connection()
+        return conn.execute(
+            'SELECT id, filepath FROM songs WHERE partial_hash IS NULL'
+        ).fetchall()
+    
+    def set_file_hashes(self, hashes, column='partial_hash', batch_size=None):
+        """Store (song_id, hash) pairs in the partial_hash or content_hash column"""
+        if column not in ('partial_hash', 'content_hash'):
+            raise ValueError(f"Not a hash column: {column}")
+        
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        rows = ((file_hash, song_id) for song_id, file_hash in hashes)
+        
+        conn = self.get_connection()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany(f'UPDATE songs SET {column} = ? WHERE id = ?', batch)
+    
+    def get_duplicate_candidates(self):
+        """Get songs that share their size and partial hash with another song
+        
+        Rows are ordered so each candidate group is contiguous, largest
+        files first.
+        """
+        conn = self.get_connection()
+        return conn.execute('''
+            SELECT id, title, artist, filepath, filesize, partial_hash, content_hash
+            FROM songs
+            WHERE (filesize, partial_hash) IN (
+                SELECT filesize, partial_hash FROM songs
+                WHERE partial_hash IS NOT NULL
+                GROUP BY filesize, partial_hash
+                HAVING COUNT(*) > 1
+            )
+            ORDER BY filesize DESC, partial_hash, id
+        ''').fetchall()
     
     def get_song(self, song_id):
         """Get song by ID"""
@@ -98,16 +620,121 @@ class Database:
             cursor.execute('SELECT * FROM songs ORDER BY title')
             return cursor.fetchall()
     
-    def search_songs(self, query):
-        """Search songs by title or artist"""
+    def count_songs(self):
+        """Get the number of songs in the library"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            search_term = f'%{query}%'
-            cursor.execute('''
+            cursor.execute(f'SELECT COUNT(*) FROM songs WHERE id NOT IN ({self.MISSING_SONG_IDS})')
+            return cursor.fetchone()[0]
+    
+    def _check_sort(self, sort):
+        if sort not in self.SONG_SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort}")
+    
+    def get_songs_page(self, sort='title', after=None, limit=None, descending=False,
+                       columns=None):
+        """Get one page of songs ordered by (sort, id)
+        
+        after is the (sort value, id) key of the last row of the previous
+        page, or None for the first page. Use song_sort_key() to build it.
+        Only SONG_LIST_COLUMNS are fetched unless columns says otherwise.
+        """
+        self._check_sort(sort)
+        limit = limit or Config.DB_PAGE_SIZE
+        direction = 'DESC' if descending else 'ASC'
+        
+        where = f'WHERE id NOT IN ({self.MISSING_SONG_IDS})'
+        args = []
+        if after is not None:
+            where += f' AND ({sort}, id) {"<" if descending else ">"} (?, ?)'
+            args.extend(after)
+        args.append(limit)
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {columns or self.SONG_LIST_COLUMNS} FROM songs 
+                {where}
+                ORDER BY {sort} {direction}, id {direction}
+                LIMIT ?
+            ''', args)
+            return cursor.fetchall()
+    
+    def iter_songs(self, sort='title', page_size=None, descending=False, columns='*'):
+        """Yield every song in (sort, id) order, one page in memory at a time"""
+        after = None
+        while True:
+            page = self.get_songs_page(sort, after, page_size, descending, columns)
+            yield from page
+            if len(page) < (page_size or Config.DB_PAGE_SIZE):
+                return
+            after = self.song_sort_key(page[-1], sort)
+    
+    def get_sorted_song_ids(self, sort='title', descending=False):
+        """Get every song id in (sort, id) order as a compact array"""
+        self._check_sort(sort)
+        direction = 'DESC' if descending else 'ASC'
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                f'SELECT id FROM songs WHERE id NOT IN ({self.MISSING_SONG_IDS}) '
+                f'ORDER BY {sort} {direction}, id {direction}'
+            )
+            return array('q', (row[0] for row in rows))
+    
+    @staticmethod
+    def song_sort_key(song, sort='title'):
+        """Get the keyset cursor for a song row"""
+        return (song[sort], song['id'])
+    
+    def get_most_played(self, limit=50):
+        """Get the most played songs"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT * FROM songs 
+                WHERE play_count > 0 AND id NOT IN ({self.MISSING_SONG_IDS})
+                ORDER BY play_count DESC, id 
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
+    
+    def get_recently_added(self, limit=50):
+        """Get the most recently added songs"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
                 SELECT * FROM songs 
-                WHERE title LIKE ? OR artist LIKE ? 
-                ORDER BY title
-            ''', (search_term, search_term))
+                WHERE id NOT IN ({self.MISSING_SONG_IDS})
+                ORDER BY added_date DESC, id DESC 
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
+    
+    def search_songs(self, query, limit=None):
+        """Search songs by title, artist or album, best matches first"""
+        match_query = self._build_match_query(query) if self.fts_enabled else None
+        limit_clause = 'LIMIT ?' if limit else ''
+        limit_args = (limit,) if limit else ()
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if match_query:
+                cursor.execute(f'''
+                    SELECT s.* FROM songs_fts
+                    JOIN songs s ON s.id = songs_fts.rowid
+                    WHERE songs_fts MATCH ? AND s.id NOT IN ({self.MISSING_SONG_IDS})
+                    ORDER BY bm25(songs_fts, 10.0, 5.0, 2.0), s.title
+                    {limit_clause}
+                ''', (match_query,) + limit_args)
+            else:
+                search_term = f'%{query}%'
+                cursor.execute(f'''
+                    SELECT * FROM songs 
+                    WHERE (title LIKE ? OR artist LIKE ? OR album LIKE ?)
+                        AND id NOT IN ({self.MISSING_SONG_IDS})
+                    ORDER BY title
+                    {limit_clause}
+                ''', (search_term, search_term, search_term) + limit_args)
             return cursor.fetchall()
     
     def update_song(self, song_id, **kwargs):
@@ -126,6 +753,33 @@ class Database:
             ''', values)
             conn.commit()
     
+    def update_songs(self, updates):
+        """Apply (song_id, {column: value}) updates in one transaction"""
+        with self.get_connection() as conn:
+            for song_id, fields in updates:
+                set_clause = ', '.join(f'{k} = ?' for k in fields)
+                conn.execute(
+                    f'UPDATE songs SET {set_clause} WHERE id = ?',
+                    [*fields.values(), song_id]
+                )
+    
+    def get_file_probe(self, filepath, filesize, mtime_ns):
+        """Get the stored probe of a file, or None if it changed since"""
+        with self.get_connection() as conn:
+            return conn.execute('''
+                SELECT * FROM file_probes 
+                WHERE filepath = ? AND filesize = ? AND mtime_ns = ?
+            ''', (str(filepath), filesize, mtime_ns)).fetchone()
+    
+    def set_file_probe(self, filepath, filesize, mtime_ns, playable, codec=None, duration=0):
+        """Store what probing a file found, replacing any older probe"""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO file_probes 
+                    (filepath, filesize, mtime_ns, playable, codec, duration)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (str(filepath), filesize, mtime_ns, int(playable), codec, duration or 0))
+    
     def delete_song(self, song_id):
         """Delete song from database"""
         with self.get_connection() as conn:
@@ -145,6 +799,22 @@ class Database:
             ''', (song_id,))
             conn.commit()
     
+    def add_play_counts(self, plays):
+        """Apply buffered plays in one transaction
+        
+        plays is an iterable of (song_id, play_count, last_played) tuples,
+        where last_played uses the CURRENT_TIMESTAMP format.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE songs 
+                SET play_count = play_count + ?, 
+                    last_played = MAX(IFNULL(last_played, ''), ?) 
+                WHERE id = ?
+            ''', ((count, last_played, song_id) for song_id, count, last_played in plays))
+            conn.commit()
+    
     # Playlist operations
     def create_playlist(self, name, description=''):
         """Create a new playlist"""
@@ -204,122 +874,217 @@ class Database:
             cursor.execute('DELETE FROM playlists WHERE id = ?', (playlist_id,))
             conn.commit()
     
+    def repair_playlist_counts(self, cursor=None):
+        """Recompute every playlist's song_count, returns how many were wrong"""
+        if cursor is None:
+            with self.get_connection() as conn:
+                return self.repair_playlist_counts(conn.cursor())
+        
+        cursor.execute('''
+            UPDATE playlists 
+            SET song_count = (
+                SELECT COUNT(*) FROM playlist_songs 
+                WHERE playlist_id = playlists.id
+            )
+            WHERE song_count IS NOT (
+                SELECT COUNT(*) FROM playlist_songs 
+                WHERE playlist_id = playlists.id
+            )
+        ''')
+        return cursor.rowcount
+    
     def add_song_to_playlist(self, playlist_id, song_id):
         """Add song to playlist"""
+        self.add_songs_to_playlist(playlist_id, [song_id])
+    
+    def add_songs_to_playlist(self, playlist_id, song_ids, at=None):
+        """Add songs to playlist in order, in one transaction
+        
+        at is the 0-based index to insert before; None appends. Songs that
+        are already in the playlist keep their current position. Returns
+        the number of songs added.
+        """
+        gap = Config.PLAYLIST_POSITION_GAP
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get current max position
-            cursor.execute('''
-                SELECT MAX(position) FROM playlist_songs 
-                WHERE playlist_id = ?
-            ''', (playlist_id,))
-            result = cursor.fetchone()
-            position = (result[0] or 0) + 1
+            # Drop duplicates and songs the playlist already has
+            new_ids = []
+            for song_id in dict.fromkeys(song_ids):
+                cursor.execute('''
+                    SELECT 1 FROM playlist_songs 
+                    WHERE playlist_id = ? AND song_id = ?
+                ''', (playlist_id, song_id))
+                if not cursor.fetchone():
+                    new_ids.append(song_id)
             
-            # Add song
-            cursor.execute('''
-                INSERT OR IGNORE INTO playlist_songs (playlist_id, song_id, position)
-                VALUES (?, ?, ?)
-            ''', (playlist_id, song_id, position))
+            if not new_ids:
+                return 0
             
-            # Update song count
-            cursor.execute('''
-                UPDATE playlists 
-                SET song_count = (
+            if at is None:
+                # Get current max position
+                cursor.execute('''
+                    SELECT MAX(position) FROM playlist_songs 
+                    WHERE playlist_id = ?
+                ''', (playlist_id,))
+                result = cursor.fetchone()
+                last = result[0] or 0
+                positions = [last + gap * i for i in range(1, len(new_ids) + 1)]
+            else:
+                cursor.execute('''
                     SELECT COUNT(*) FROM playlist_songs 
                     WHERE playlist_id = ?
-                )
-                WHERE id = ?
-            ''', (playlist_id, playlist_id))
+                ''', (playlist_id,))
+                at = max(0, min(at, cursor.fetchone()[0]))
+                positions = self._positions_at(cursor, playlist_id, at, len(new_ids))
+            
+            if positions is None:
+                # Not enough room between the neighbours, respace around the batch
+                self.compact_playlist(playlist_id, cursor, insert_at=at, song_ids=new_ids)
+            else:
+                cursor.executemany('''
+                    INSERT INTO playlist_songs (playlist_id, song_id, position)
+                    VALUES (?, ?, ?)
+                ''', ((playlist_id, song_id, position)
+                      for song_id, position in zip(new_ids, positions)))
             
             conn.commit()
+            return len(new_ids)
     
     def remove_song_from_playlist(self, playlist_id, song_id):
         """Remove song from playlist"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Positions are sparse, so the remaining rows keep theirs
             cursor.execute('''
                 DELETE FROM playlist_songs 
                 WHERE playlist_id = ? AND song_id = ?
             ''', (playlist_id, song_id))
             
-            # Update positions
-            cursor.execute('''
-                UPDATE playlist_songs 
-                SET position = position - 1 
-                WHERE playlist_id = ? AND position > (
-                    SELECT position FROM playlist_songs 
-                    WHERE playlist_id = ? AND song_id = ?
-                )
-            ''', (playlist_id, playlist_id, song_id))
-            
-            # Update song count
-            cursor.execute('''
-                UPDATE playlists 
-                SET song_count = (
-                    SELECT COUNT(*) FROM playlist_songs 
-                    WHERE playlist_id = ?
-                )
-                WHERE id = ?
-            ''', (playlist_id, playlist_id))
-            
             conn.commit()
     
     def get_playlist_songs(self, playlist_id):
         """Get all songs in a playlist"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT s.*, ps.position 
                 FROM songs s
                 JOIN playlist_songs ps ON s.id = ps.song_id
-                WHERE ps.playlist_id = ?
+                WHERE ps.playlist_id = ? AND s.id NOT IN ({self.MISSING_SONG_IDS})
                 ORDER BY ps.position
             ''', (playlist_id,))
             return cursor.fetchall()
     
+    def get_playlist_song_ids(self, playlist_id):
+        """Get a playlist's song ids in order as a compact array"""
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT song_id FROM playlist_songs 
+                WHERE playlist_id = ? AND song_id NOT IN ({self.MISSING_SONG_IDS})
+                ORDER BY position
+            ''', (playlist_id,))
+            return array('q', (row[0] for row in rows))
+    
+    def _positions_at(self, cursor, playlist_id, index, count=1, exclude_song_id=None):
+        """Get count free, increasing positions that sort at index (0-based)
+        
+        Returns None when there is not enough room between the neighbouring
+        positions and the playlist has to be compacted first.
+        """
+        gap = Config.PLAYLIST_POSITION_GAP
+        cursor.execute('''
+            SELECT COUNT(*) FROM playlist_songs 
+            WHERE playlist_id = ? AND song_id IS NOT ?
+        ''', (playlist_id, exclude_song_id))
+        # Past the end means at the end, as in compact_playlist
+        index = min(index, cursor.fetchone()[0])
+        
+        cursor.execute('''
+            SELECT position FROM playlist_songs 
+            WHERE playlist_id = ? AND song_id IS NOT ?
+            ORDER BY position
+            LIMIT 2 OFFSET ?
+        ''', (playlist_id, exclude_song_id, max(index - 1, 0)))
+        neighbours = [row[0] for row in cursor.fetchall()]
+        
+        if index <= 0:
+            before, after = None, neighbours[0] if neighbours else None
+        else:
+            before = neighbours[0] if neighbours else None
+            after = neighbours[1] if len(neighbours) > 1 else None
+        
+        if before is None and after is None:
+            return [gap * i for i in range(1, count + 1)]
+        if before is None:
+            return [after - gap * i for i in range(count, 0, -1)]
+        if after is None:
+            return [before + gap * i for i in range(1, count + 1)]
+        
+        step = (after - before) // (count + 1)
+        if step < 1:
+            return None
+        return [before + step * i for i in range(1, count + 1)]
+    
+    def compact_playlist(self, playlist_id, cursor=None, insert_at=None, song_ids=()):
+        """Renumber playlist positions so they are evenly spaced again
+        
+        song_ids, if given, are new songs inserted at index insert_at
+        (None appends) as part of the same pass.
+        """
+        if cursor is None:
+            with self.get_connection() as conn:
+                return self.compact_playlist(playlist_id, conn.cursor(), insert_at, song_ids)
+        
+        gap = Config.PLAYLIST_POSITION_GAP
+        cursor.execute('''
+            SELECT song_id FROM playlist_songs 
+            WHERE playlist_id = ? 
+            ORDER BY position
+        ''', (playlist_id,))
+        existing = [row[0] for row in cursor.fetchall()]
+        
+        index = len(existing) if insert_at is None else min(insert_at, len(existing))
+        ordered = existing[:index] + list(song_ids) + existing[index:]
+        positions = {song_id: i * gap for i, song_id in enumerate(ordered, 1)}
+        
+        cursor.executemany('''
+            UPDATE playlist_songs 
+            SET position = ? 
+            WHERE playlist_id = ? AND song_id = ?
+        ''', ((positions[song_id], playlist_id, song_id) for song_id in existing))
+        cursor.executemany('''
+            INSERT INTO playlist_songs (playlist_id, song_id, position)
+            VALUES (?, ?, ?)
+        ''', ((playlist_id, song_id, positions[song_id]) for song_id in song_ids))
+        logger.info(f"Compacted playlist {playlist_id} ({len(ordered)} songs)")
+    
     def reorder_playlist_song(self, playlist_id, song_id, new_position):
-        """Reorder song in playlist"""
+        """Move song to new_position (1-based) in playlist"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get current position
             cursor.execute('''
-                SELECT position FROM playlist_songs 
+                SELECT 1 FROM playlist_songs 
                 WHERE playlist_id = ? AND song_id = ?
             ''', (playlist_id, song_id))
-            result = cursor.fetchone()
-            
-            if not result:
+            if not cursor.fetchone():
                 return
             
-            old_position = result[0]
+            index = max(new_position - 1, 0)
+            positions = self._positions_at(cursor, playlist_id, index, 1, song_id)
+            if positions is None:
+                # No room between the neighbours, respace and try again
+                self.compact_playlist(playlist_id, cursor)
+                positions = self._positions_at(cursor, playlist_id, index, 1, song_id)
+            position = positions[0]
             
-            if old_position < new_position:
-                # Move down
-                cursor.execute('''
-                    UPDATE playlist_songs 
-                    SET position = position - 1 
-                    WHERE playlist_id = ? 
-                    AND position > ? 
-                    AND position <= ?
-                ''', (playlist_id, old_position, new_position))
-            else:
-                # Move up
-                cursor.execute('''
-                    UPDATE playlist_songs 
-                    SET position = position + 1 
-                    WHERE playlist_id = ? 
-                    AND position >= ? 
-                    AND position < ?
-                ''', (playlist_id, new_position, old_position))
-            
-            # Update moved song
+            # Only the moved song is rewritten
             cursor.execute('''
                 UPDATE playlist_songs 
                 SET position = ? 
                 WHERE playlist_id = ? AND song_id = ?
-            ''', (new_position, playlist_id, song_id))
+            ''', (position, playlist_id, song_id))
             
-            conn.commit()
\ No newline at end of file
+            conn.commit()
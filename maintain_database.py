@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database
+from modules.file_manager import FileManager
+
+def check_plans(db, args):
+    """Check that the hot queries use their indexes"""
+    failures = db.check_query_plans()
+    
+    for sql, expected, plan in failures:
+        print(f"FAIL: expected {expected}")
+        print(f"  query: {' '.join(sql.split())}")
+        print(f"  plan:  {plan}")
+    
+    if failures:
+        return 1
+    
+    print(f"Schema version {db.get_schema_version()}: all query plans OK")
+    return 0
+
+def repair_counts(db, args):
+    """Recompute every playlist's song count"""
+    fixed = db.repair_playlist_counts()
+    print(f"Repaired {fixed} playlist song counts")
+    return 0
+
+def duplicates(db, args):
+    """List songs whose files are byte-identical"""
+    groups = FileManager(db).find_duplicates(workers=args.workers)
+    
+    wasted = 0
+    for group in groups:
+        original, copies = group[0], group[1:]
+        wasted += original['filesize'] * len(copies)
+        print(f"{original['artist']} - {original['title']} ({original['filesize'] / 1e6:.1f} MB)")
+        print(f"  keep: {original['filepath']}")
+        for song in copies:
+            print(f"  copy: {song['filepath']}")
+    
+    print(f"{len(groups)} duplicate groups, {wasted / 1e6:.1f} MB in copies")
+    return 0
+
+def organize(db, args):
+    """Move songs into Artist/Album (or Artist, or Flat) folders"""
+    file_manager = FileManager(db)
+    result = file_manager.organize_library(args.pattern, dry_run=args.dry_run,
+                                           workers=args.workers)
+    
+    if args.dry_run:
+        for song_id, old_path, new_path, *_ in result['moves']:
+            print(f"{old_path}\n  -> {new_path}")
+        print(f"{len(result['moves'])} songs to move, {len(result['renamed'])} renamed "
+              f"to avoid conflicts, {len(result['missing'])} missing files skipped")
+        return 0
+    
+    print(f"Moved {result['moved'] + result['copied']} songs "
+          f"({result['copied']} copied across devices), {result['failed']} failed")
+    return 1 if result['failed'] else 0
+
+def prune(db, args):
+    """Delete or flag songs whose files no longer exist"""
+    stats = FileManager(db).prune_missing(delete=not args.flag)
+    
+    action = "Flagged" if args.flag else "Deleted"
+    print(f"Checked {stats['checked']} songs in {stats['directories']} folders")
+    print(f"{action} {stats['missing']} missing songs, skipped {stats['skipped']} "
+          f"in unreadable or offline folders")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Music library database maintenance")
+    parser.add_argument('--db', help="database file (defaults to the library database)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    plans = subparsers.add_parser('check-plans', help=check_plans.__doc__)
+    plans.set_defaults(func=check_plans)
+    
+    counts = subparsers.add_parser('repair-counts', help=repair_counts.__doc__)
+    counts.set_defaults(func=repair_counts)
+    
+    dupes = subparsers.add_parser('duplicates', help=duplicates.__doc__)
+    dupes.add_argument('--workers', type=int, default=None,
+                       help="parallel file hashers")
+    dupes.set_defaults(func=duplicates)
+    
+    organize_parser = subparsers.add_parser('organize', help=organize.__doc__)
+    organize_parser.add_argument('--pattern', choices=['Artist/Album', 'Artist', 'Flat'],
+                                 default='Artist/Album')
+    organize_parser.add_argument('--dry-run', action='store_true',
+                                 help="show the planned moves without making them")
+    organize_parser.add_argument('--workers', type=int, default=None,
+                                 help="parallel copies for moves across devices")
+    organize_parser.set_defaults(func=organize)
+    
+    prune_parser = subparsers.add_parser('prune', help=prune.__doc__)
+    prune_parser.add_argument('--flag', action='store_true',
+                              help="mark missing songs instead of deleting them")
+    prune_parser.set_defaults(func=prune)
+    
+    args = parser.parse_args()
+    
+    db = Database(args.db)
+    try:
+        return args.func(db, args)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import os
+import hashlib
+from config import Config
+
+class FileHasher:
+    @staticmethod
+    def partial_hash(file_path):
+        """Hash of the file size and its first and last HASH_BLOCK_SIZE bytes
+
+        Files up to two blocks long are hashed in full, so for them equal
+        partial hashes already mean equal content.
+        """
+        block = Config.HASH_BLOCK_SIZE
+        digest = hashlib.blake2b(digest_size=16)
+
+        with open(file_path, 'rb') as fileobj:
+            size = os.fstat(fileobj.fileno()).st_size
+            digest.update(size.to_bytes(8, 'little'))
+            digest.update(fileobj.read(block))
+            if size > block:
+                fileobj.seek(max(block, size - block))
+                digest.update(fileobj.read(block))
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def full_hash(file_path):
+        """Hash of the whole file contents"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as fileobj:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
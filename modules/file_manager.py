@@ -1,51 +1,434 @@
 import os
 import shutil
+import signal
+import time
+from collections import defaultdict
+import multiprocessing
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+)
+from itertools import islice
 from pathlib import Path
 from config import Config
+from modules.tag_reader import TagReader
+from modules.tag_writer import TAG_FIELDS, TagWriter
+from modules.file_hasher import FileHasher
+from modules.library_organizer import LibraryOrganizer
 import logging
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB
-from mutagen.easyid3 import EasyID3
 
 logger = logging.getLogger(__name__)
 
+# Per-process reader used by scan workers
+_worker_file_manager = None
+
+def _ignore_interrupts():
+    """Scan worker initializer: leave Ctrl+C to the parent, which cancels the scan"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _read_song_records(files):
+    """Scan worker: build add_songs records for a chunk of (path, fingerprint)"""
+    global _worker_file_manager
+    if _worker_file_manager is None:
+        _worker_file_manager = FileManager(None)
+    
+    songs = []
+    for path, fingerprint in files:
+        song = _worker_file_manager._song_record(path, fingerprint)
+        if song:
+            songs.append(song)
+    return songs
+
 class FileManager:
     def __init__(self, database):
         self.db = database
         self.downloads_dir = Config.DOWNLOADS_DIR
     
-    def scan_library(self):
-        """Scan downloads folder for music files"""
-        music_files = []
+    def _walk_music_files(self, root, unlisted=None):
+        """Yield (path, stat) for every supported file under root, noting unreadable folders in unlisted"""
+        pending = [str(root)]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            elif os.path.splitext(entry.name)[1].lower() in Config.SUPPORTED_FORMATS:
+                                yield entry.path, entry.stat()
+                        except OSError as e:
+                            logger.error(f"Error reading {entry.path}: {e}")
+            except OSError as e:
+                logger.error(f"Error scanning {directory}: {e}")
+                if unlisted is not None:
+                    unlisted.append(directory)
+    
+    def _tag_executor(self, workers=None):
+        """Pool for reading tags with workers, or None to read in-process"""
+        workers = Config.SCAN_WORKERS if workers is None else workers
+        if workers <= 1:
+            return None
         
-        for file in self.downloads_dir.rglob('*'):
-            if file.suffix.lower() in Config.SUPPORTED_FORMATS:
+        if Config.SCAN_EXECUTOR == 'process':
+            # Spawn rather than fork, the GUI process has threads running
+            return ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_ignore_interrupts
+            )
+        return ThreadPoolExecutor(max_workers=workers)
+    
+    def _parse_files(self, files, workers=None, executor=None):
+        """Yield add_songs records for (path, fingerprint) pairs, reading tags on executor or a new pool"""
+        workers = Config.SCAN_WORKERS if workers is None else workers
+        owned = executor is None
+        if owned:
+            executor = self._tag_executor(workers)
+        if executor is None:
+            for path, fingerprint in files:
+                song = self._song_record(path, fingerprint)
+                if song:
+                    yield song
+            return
+        
+        try:
+            pending = set()
+            chunks = iter(lambda: list(islice(files, Config.SCAN_CHUNK_SIZE)), [])
+            for chunk in chunks:
+                pending.add(executor.submit(_read_song_records, chunk))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            
+            for future in as_completed(pending):
+                yield from future.result()
+        finally:
+            if owned:
+                executor.shutdown(wait=True, cancel_futures=True)
+    
+    def scan_library(self, batch_size=None, workers=None, root=None,
+                     cancel=None, progress=None):
+        """Scan downloads folder for new, changed, moved and missing files; returns the final counts"""
+        for event in self.iter_scan(root, batch_size, workers, cancel):
+            if event['event'] == 'progress' and progress:
+                progress(event)
+            elif event['event'] == 'done':
+                stats = event
+        
+        logger.info(
+            f"Scanned {stats['seen']} files: {stats['added']} added, {stats['updated']} changed, "
+            f"{stats['moved']} moved, {stats['removed']} removed"
+            + (" (cancelled)" if stats['cancelled'] else "")
+        )
+        return stats
+    
+    def iter_scan(self, root=None, batch_size=None, workers=None, cancel=None):
+        """Scan a library root, yielding 'file', 'progress' and finally 'done' events
+        
+        'file' events carry path, status and song_id; 'progress' and
+        'done' carry the running counts, and 'done' adds cancelled and
+        unlisted.
+        """
+        root = str(root or self.downloads_dir)
+        known = self.db.get_file_fingerprints(prefix=root)
+        # A missing or unreadable root is reported here and removes nothing
+        unlisted = []
+        return self._iter_sync(
+            self._walk_music_files(root, unlisted), known, batch_size, workers, cancel, unlisted
+        )
+    
+    def sync_directories(self, directories, watched=(), batch_size=None, workers=1, roots=()):
+        """Bring the songs directly inside directories up to date
+        
+        Returns the scan_library counts plus 'changes' (song ids added,
+        updated, moved and removed) and 'new_dirs'.
+        """
+        watched = set(watched)
+        roots = {str(root) for root in roots}
+        files = []
+        known = {}
+        new_dirs = []
+        gone = set()
+        unlisted = []
+        
+        for directory in dict.fromkeys(str(d) for d in directories):
+            if not os.path.isdir(directory):
                 try:
-                    # Extract metadata
-                    metadata = self.extract_metadata(file)
-                    
-                    # Add to database
-                    song_id = self.db.add_song(
-                        title=metadata['title'],
-                        artist=metadata['artist'],
-                        filepath=str(file),
-                        duration=metadata['duration'],
-                        album=metadata['album'],
-                        filesize=file.stat().st_size,
-                        bitrate=metadata.get('bitrate', 0)
-                    )
-                    
-                    if song_id:
-                        music_files.append({
-                            'id': song_id,
-                            'path': str(file),
-                            'metadata': metadata
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"Error processing {file}: {e}")
-        
-        return music_files
+                    os.stat(directory)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Still there as far as we know, just not reachable
+                    logger.error(f"Error scanning {directory}: {e}")
+                    continue
+                if directory in roots:
+                    logger.warning(f"Library folder {directory} is gone, keeping its songs")
+                else:
+                    gone.add(directory)
+                continue
+            
+            subdirs = set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.add(entry.path)
+                            elif os.path.splitext(entry.name)[1].lower() in Config.SUPPORTED_FORMATS:
+                                files.append((entry.path, entry.stat()))
+                        except OSError as e:
+                            logger.error(f"Error reading {entry.path}: {e}")
+            except OSError as e:
+                logger.error(f"Error scanning {directory}: {e}")
+                continue
+            
+            for path, record in self.db.get_file_fingerprints(prefix=directory).items():
+                if os.path.dirname(path) == directory:
+                    known[path] = record
+            
+            for subdir in subdirs - watched:
+                for root, _, _ in os.walk(subdir):
+                    new_dirs.append(root)
+                files.extend(self._walk_music_files(subdir, unlisted))
+                known.update(self.db.get_file_fingerprints(prefix=subdir))
+            
+            gone.update(
+                path for path in watched
+                if os.path.dirname(path) == directory and path not in subdirs
+            )
+        
+        for directory in gone:
+            known.update(self.db.get_file_fingerprints(prefix=directory))
+        
+        changes = {'added': [], 'updated': [], 'moved': [], 'removed': []}
+        for event in self._iter_sync(iter(files), known, batch_size, workers, unlisted=unlisted):
+            if event['event'] == 'done':
+                stats = event
+            elif event['event'] == 'file' and event['status'] in changes:
+                changes[event['status']].append(event.get('song_id', event['path']))
+        
+        # Added and updated songs are only known by path until written
+        for key in ('added', 'updated'):
+            ids = self.db.get_song_ids(changes[key])
+            changes[key] = [ids[path] for path in changes[key] if path in ids]
+        
+        stats['changes'] = changes
+        stats['new_dirs'] = list(dict.fromkeys(new_dirs))
+        return stats
+    
+    def _iter_sync(self, files, known, batch_size=None, workers=None, cancel=None,
+                   unlisted=()):
+        """Reconcile (path, stat) pairs against known, yielding iter_scan events"""
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        # A new path carrying a known fingerprint whose file is gone was moved
+        by_fingerprint = {record[1:]: path for path, record in known.items()}
+        stats = {
+            'seen': 0, 'unchanged': 0, 'parsed': 0, 'failed': 0, 'bytes': 0,
+            'added': 0, 'updated': 0, 'moved': 0, 'removed': 0
+        }
+        started = last_progress = time.monotonic()
+        cancelled = False
+        pending = []
+        moves = []
+        
+        executor = self._tag_executor(workers)
+        try:
+            for path, stat in files:
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                    break
+                
+                stats['seen'] += 1
+                stats['bytes'] += stat.st_size
+                fingerprint = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                
+                record = known.pop(path, None)
+                if record is None:
+                    old_path = by_fingerprint.get(fingerprint)
+                    if old_path in known and not os.path.lexists(old_path):
+                        song_id = known.pop(old_path)[0]
+                        moves.append((song_id, path) + fingerprint)
+                        stats['moved'] += 1
+                        yield {'event': 'file', 'path': path, 'status': 'moved', 'song_id': song_id}
+                    else:
+                        pending.append((path, fingerprint, 'added'))
+                elif record[1:] == fingerprint:
+                    stats['unchanged'] += 1
+                    yield {'event': 'file', 'path': path, 'status': 'unchanged'}
+                else:
+                    pending.append((path, fingerprint, 'updated'))
+                
+                if len(moves) >= batch_size:
+                    self.db.move_songs(moves, batch_size=batch_size)
+                    moves = []
+                if len(pending) >= batch_size:
+                    yield from self._write_batch(pending, workers, executor, stats)
+                    pending = []
+                
+                now = time.monotonic()
+                if now - last_progress >= Config.SCAN_PROGRESS_INTERVAL:
+                    last_progress = now
+                    yield self._progress_event(stats, now - started)
+            
+            self.db.move_songs(moves, batch_size=batch_size)
+            if pending and not cancelled:
+                yield from self._write_batch(pending, workers, executor, stats)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        
+        if not cancelled:
+            # Songs under a folder that could not be listed may still be there
+            for directory in unlisted:
+                prefix = os.path.join(directory, '')
+                for path in [path for path in known if path.startswith(prefix)]:
+                    del known[path]
+            
+            # Whatever is left in known was not found
+            missing = [(path, record[0]) for path, record in known.items()]
+            stats['removed'] = self.db.delete_songs(
+                (song_id for _, song_id in missing), batch_size=batch_size
+            )
+            for path, song_id in missing:
+                yield {'event': 'file', 'path': path, 'status': 'removed', 'song_id': song_id}
+        
+        yield self._progress_event(stats, time.monotonic() - started)
+        yield dict(stats, event='done', cancelled=cancelled, unlisted=len(unlisted))
+    
+    def _write_batch(self, pending, workers, executor, stats):
+        """Read tags for one batch of (path, fingerprint, status) and store it"""
+        statuses = {path: status for path, _, status in pending}
+        songs = list(self._parse_files(
+            ((path, fingerprint) for path, fingerprint, _ in pending), workers, executor
+        ))
+        self.db.add_songs(songs, batch_size=len(pending))
+        stats['parsed'] += len(songs)
+        
+        for song in songs:
+            status = statuses.pop(song['filepath'])
+            stats[status] += 1
+            yield {'event': 'file', 'path': song['filepath'], 'status': status}
+        
+        # Anything not returned could not be read
+        for path in statuses:
+            stats['failed'] += 1
+            yield {'event': 'file', 'path': path, 'status': 'failed'}
+    
+    def _progress_event(self, stats, elapsed):
+        return dict(
+            stats, event='progress', skipped=stats['unchanged'], elapsed=elapsed,
+            rate=stats['seen'] / elapsed if elapsed > 0 else 0.0
+        )
+    
+    def prune_missing(self, delete=True):
+        """Delete, or flag as missing, songs whose files have disappeared; returns a dict of counts"""
+        by_directory = defaultdict(list)
+        for path, record in self.db.get_file_fingerprints().items():
+            directory, name = os.path.split(path)
+            by_directory[directory].append((name, record[0]))
+        
+        offline_roots = [str(root) for root in Config.LIBRARY_DIRS if not os.path.isdir(root)]
+        flagged = set() if delete else self.db.get_missing_song_ids()
+        missing = []
+        found = []
+        skipped = 0
+        for directory, songs in by_directory.items():
+            try:
+                with os.scandir(directory) as entries:
+                    names = {entry.name for entry in entries}
+            except FileNotFoundError:
+                if any(directory == root or directory.startswith(root + os.sep)
+                       for root in offline_roots):
+                    skipped += len(songs)
+                    continue
+                names = set()
+            except OSError as e:
+                logger.warning(f"Cannot list {directory}, keeping its songs: {e}")
+                skipped += len(songs)
+                continue
+            
+            missing.extend(song_id for name, song_id in songs if name not in names)
+            # Flagged by an earlier pass, but listed here now
+            found.extend(song_id for name, song_id in songs if name in names and song_id in flagged)
+        
+        if delete:
+            self.db.delete_songs(missing, batch_size=max(len(missing), 1))
+        else:
+            self.db.mark_missing_songs(missing, found)
+        
+        stats = {
+            'checked': sum(len(songs) for songs in by_directory.values()),
+            'directories': len(by_directory),
+            'missing': len(missing),
+            'skipped': skipped
+        }
+        logger.info(
+            f"Pruned library: {stats['missing']} of {stats['checked']} songs missing "
+            f"in {stats['directories']} folders ({'deleted' if delete else 'flagged'})"
+        )
+        return stats
+    
+    def find_duplicates(self, workers=None):
+        """Find songs whose files are byte-identical, as groups of song rows ordered by id"""
+        workers = workers or Config.SCAN_WORKERS
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            unhashed = self.db.get_unhashed_songs()
+            if unhashed:
+                logger.info(f"Hashing {len(unhashed)} songs for duplicate detection")
+                self.db.set_file_hashes(
+                    self._hash_files(executor, FileHasher.partial_hash, unhashed)
+                )
+            
+            candidates = self.db.get_duplicate_candidates()
+            missing = [(song['id'], song['filepath']) for song in candidates
+                       if song['content_hash'] is None]
+            if missing:
+                full_hashes = dict(self._hash_files(executor, FileHasher.full_hash, missing))
+                self.db.set_file_hashes(full_hashes.items(), column='content_hash')
+                candidates = self.db.get_duplicate_candidates()
+        
+        groups = {}
+        for song in candidates:
+            if song['content_hash'] is not None:
+                groups.setdefault((song['filesize'], song['content_hash']), []).append(song)
+        
+        return [group for group in groups.values() if len(group) > 1]
+    
+    def _hash_files(self, executor, hash_file, songs):
+        """Yield (song_id, hash) for (song_id, filepath) pairs, skipping unreadable files"""
+        def hash_song(song):
+            song_id, path = song
+            try:
+                return song_id, hash_file(path)
+            except OSError as e:
+                logger.warning(f"Cannot hash {path}: {e}")
+                return song_id, None
+        
+        for song_id, file_hash in executor.map(hash_song, songs):
+            if file_hash is not None:
+                yield song_id, file_hash
+    
+    def _song_record(self, path, fingerprint):
+        """Extract metadata for a file and build its add_songs record"""
+        try:
+            metadata = self.extract_metadata(Path(path))
+            size, mtime_ns, inode = fingerprint
+            return {
+                'title': metadata['title'],
+                'artist': metadata['artist'],
+                'filepath': path,
+                'duration': metadata['duration'],
+                'album': metadata['album'],
+                'filesize': size,
+                'bitrate': metadata.get('bitrate', 0),
+                'mtime_ns': mtime_ns,
+                'inode': inode,
+                'partial_hash': FileHasher.partial_hash(path)
+            }
+        except Exception as e:
+            logger.error(f"Error processing {path}: {e}")
+            return None
     
     def extract_metadata(self, file_path):
         """Extract metadata from audio file"""
@@ -53,8 +436,8 @@ class FileManager:
             if file_path.suffix.lower() == '.mp3':
                 return self._extract_mp3_metadata(file_path)
             else:
-                # For non-mp3 files, return basic info
-                return self._get_basic_metadata(file_path)
+                # Header-only parsers for the other formats
+                return TagReader.read(file_path)
                 
         except Exception as e:
             logger.error(f"Metadata extraction failed for {file_path}: {e}")
@@ -63,49 +446,7 @@ class FileManager:
     def _extract_mp3_metadata(self, file_path):
         """Extract metadata from MP3 file"""
         try:
-            audio = MP3(file_path)
-            
-            # Default values
-            title = file_path.stem
-            artist = 'Unknown'
-            album = ''
-            duration = audio.info.length
-            bitrate = 0
-            
-            # Try to get ID3 tags with EasyID3 first (simpler)
-            try:
-                easy = EasyID3(file_path)
-                if 'title' in easy:
-                    title = easy['title'][0]
-                if 'artist' in easy:
-                    artist = easy['artist'][0]
-                if 'album' in easy:
-                    album = easy['album'][0]
-            except:
-                # Fallback to raw ID3 tags
-                try:
-                    id3 = ID3(file_path)
-                    if 'TIT2' in id3:
-                        title = str(id3['TIT2'])
-                    if 'TPE1' in id3:
-                        artist = str(id3['TPE1'])
-                    if 'TALB' in id3:
-                        album = str(id3['TALB'])
-                except:
-                    pass
-            
-            # Get bitrate
-            if hasattr(audio.info, 'bitrate'):
-                bitrate = audio.info.bitrate // 1000  # Convert to kbps
-            
-            return {
-                'title': title[:200],
-                'artist': artist[:100],
-                'album': album[:100],
-                'duration': duration,
-                'bitrate': bitrate
-            }
-                
+            return TagReader.read_mp3(file_path)
         except Exception as e:
             logger.warning(f"MP3 metadata extraction failed for {file_path}: {e}")
             # Fallback to basic info
@@ -113,13 +454,62 @@ class FileManager:
     
     def _get_basic_metadata(self, file_path):
         """Get basic metadata when extraction fails"""
-        return {
-            'title': file_path.stem[:200],
-            'artist': 'Unknown',
-            'album': '',
-            'duration': 0,
-            'bitrate': 0
-        }
+        return TagReader.basic_metadata(file_path)
+    
+    def edit_songs(self, edits, workers=None):
+        """Apply tag changes to many songs at once
+        
+        edits maps song_id to new field values. Returns one dict per song
+        with song_id, filepath, status ('written', 'db_only' or 'failed')
+        and error.
+        """
+        jobs = []
+        results = []
+        for song_id, fields in edits.items():
+            fields = {key: value for key, value in fields.items() if key in TAG_FIELDS}
+            song = self.db.get_song(song_id)
+            if not song or not fields:
+                results.append({'song_id': song_id, 'filepath': song['filepath'] if song else None,
+                                'status': 'failed', 'error': "No such song or no tag fields"})
+                continue
+            jobs.append((song_id, song['filepath'], fields))
+        
+        updates = []
+        with ThreadPoolExecutor(max_workers=workers or Config.TAG_WRITE_WORKERS) as executor:
+            for (song_id, _, fields), (result, fingerprint) in zip(
+                    jobs, executor.map(self._write_song_tags, jobs)):
+                results.append(result)
+                if result['status'] != 'failed':
+                    updates.append((song_id, dict(fields, **fingerprint)))
+        
+        self.db.update_songs(updates)
+        
+        written = sum(result['status'] == 'written' for result in results)
+        logger.info(f"Edited {len(updates)} of {len(edits)} songs, {written} files retagged")
+        return results
+    
+    def _write_song_tags(self, job):
+        """Edit worker: write one file's tags, return (result, new fingerprint columns)"""
+        song_id, path, fields = job
+        result = {'song_id': song_id, 'filepath': path, 'status': 'failed', 'error': None}
+        fingerprint = {}
+        try:
+            if TagWriter.write(path, fields):
+                stat = os.stat(path)
+                fingerprint = {
+                    'filesize': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'inode': stat.st_ino,
+                    'partial_hash': FileHasher.partial_hash(path),
+                    'content_hash': None
+                }
+                result['status'] = 'written'
+            else:
+                result['status'] = 'db_only'
+        except Exception as e:
+            logger.error(f"Failed to write tags to {path}: {e}")
+            result['error'] = str(e)
+        return result, fingerprint
     
     def rename_song(self, song_id, new_title):
         """Rename song file and update metadata"""
@@ -140,9 +530,11 @@ class FileManager:
             # Rename file
             shutil.move(str(old_path), str(new_path))
             
-            # Update ID3 tags if MP3
-            if old_path.suffix.lower() == '.mp3':
-                self._update_mp3_tags(new_path, new_title, song['artist'], song['album'])
+            # Update the title tag
+            try:
+                TagWriter.write(new_path, {'title': new_title})
+            except Exception as e:
+                logger.error(f"Failed to update tags of {new_path}: {e}")
             
             # Update database
             self.db.update_song(song_id, title=new_title, filepath=str(new_path))
@@ -153,39 +545,6 @@ class FileManager:
             logger.error(f"Failed to rename song: {e}")
             return False
     
-    def _update_mp3_tags(self, file_path, title, artist, album):
-        """Update MP3 ID3 tags"""
-        try:
-            # Try with EasyID3 first
-            try:
-                audio = EasyID3(file_path)
-                audio['title'] = title
-                audio['artist'] = artist
-                audio['album'] = album
-                audio.save()
-            except:
-                # Fallback to raw ID3
-                try:
-                    id3 = ID3(file_path)
-                    id3.add(TIT2(encoding=3, text=title))
-                    id3.add(TPE1(encoding=3, text=artist))
-                    id3.add(TALB(encoding=3, text=album))
-                    id3.save()
-                except Exception as e:
-                    logger.error(f"Failed to update MP3 tags with ID3: {e}")
-                    # Create new ID3 tags if file doesn't have them
-                    try:
-                        id3 = ID3()
-                        id3.add(TIT2(encoding=3, text=title))
-                        id3.add(TPE1(encoding=3, text=artist))
-                        id3.add(TALB(encoding=3, text=album))
-                        id3.save(file_path)
-                    except Exception as e2:
-                        logger.error(f"Failed to create new ID3 tags: {e2}")
-                        
-        except Exception as e:
-            logger.error(f"Failed to update MP3 tags: {e}")
-    
     def delete_song(self, song_id, delete_file=False):
         """Delete song from library and optionally delete file"""
         song = self.db.get_song(song_id)
@@ -206,35 +565,13 @@ class FileManager:
         
         return True
     
-    def organize_library(self, pattern="Artist/Album"):
-        """Organize music library into folders"""
-        songs = self.db.get_all_songs()
+    def organize_library(self, pattern="Artist/Album", dry_run=False, workers=None):
+        """Organize music library into folders, or with dry_run return the plan only"""
+        organizer = LibraryOrganizer(self.db, self.downloads_dir)
+        if not dry_run:
+            organizer.resume(workers)
         
-        for song in songs:
-            try:
-                old_path = Path(song['filepath'])
-                if not old_path.exists():
-                    continue
-                
-                # Create directory structure based on pattern
-                if pattern == "Artist/Album":
-                    artist = song['artist'] or 'Unknown Artist'
-                    album = song['album'] or 'Unknown Album'
-                    new_dir = self.downloads_dir / artist / album
-                elif pattern == "Artist":
-                    artist = song['artist'] or 'Unknown Artist'
-                    new_dir = self.downloads_dir / artist
-                else:  # pattern == "Flat"
-                    new_dir = self.downloads_dir
-                
-                new_dir.mkdir(parents=True, exist_ok=True)
-                new_path = new_dir / old_path.name
-                
-                # Move file
-                if old_path != new_path:
-                    shutil.move(str(old_path), str(new_path))
-                    # Update database
-                    self.db.update_song(song['id'], filepath=str(new_path))
-                    
-            except Exception as e:
-                logger.error(f"Failed to organize {song['title']}: {e}")
\ No newline at end of file
+        plan = organizer.plan(pattern)
+        if dry_run:
+            return plan
+        return organizer.execute(plan, workers)
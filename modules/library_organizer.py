@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Characters that cannot appear in a folder name on common filesystems
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+class LibraryOrganizer:
+    """Moves songs into Artist/Album folders in two phases
+
+    plan() works out every target path up front, renaming around
+    conflicts, without touching the disk. execute() writes the plan to a
+    journal, renames files that stay on the same device and copies the
+    others on a thread pool, then points all moved songs at their new
+    paths in a single transaction. If the app dies mid-way, resume()
+    finishes the journaled plan on the next run.
+    """
+
+    def __init__(self, database, root=None, journal_path=None):
+        self.db = database
+        self.root = Path(root or Config.DOWNLOADS_DIR)
+        self.journal_path = Path(journal_path or Config.ORGANIZE_JOURNAL_PATH)
+
+    @staticmethod
+    def _safe_name(name, default):
+        name = _UNSAFE_CHARS.sub('_', name or '').strip(' .')
+        return name[:100] or default
+
+    def _target_dir(self, song, pattern):
+        if pattern == "Artist/Album":
+            return (self.root
+                    / self._safe_name(song['artist'], 'Unknown Artist')
+                    / self._safe_name(song['album'], 'Unknown Album'))
+        if pattern == "Artist":
+            return self.root / self._safe_name(song['artist'], 'Unknown Artist')
+        return self.root  # Flat
+
+    def plan(self, pattern="Artist/Album"):
+        """Work out where every song goes without moving anything
+
+        Returns a dict with 'moves' ([song_id, old path, new path, size,
+        mtime_ns] lists, the last two identifying the file being moved),
+        'renamed' (song ids whose file name got a " (n)" suffix because
+        the target was taken) and 'missing' (song ids whose file is gone).
+        """
+        moves = []
+        renamed = []
+        missing = []
+        taken = set()
+
+        for song in self.db.iter_songs(columns='id, title, artist, album, filepath'):
+            old_path = Path(song['filepath'])
+            try:
+                stat = old_path.stat()
+            except OSError:
+                missing.append(song['id'])
+                continue
+
+            new_dir = self._target_dir(song, pattern)
+            new_path = new_dir / old_path.name
+            if new_path == old_path:
+                taken.add(os.path.normcase(str(new_path)))
+                continue
+
+            # Never overwrite a file on disk or another song's target
+            counter = 1
+            while os.path.normcase(str(new_path)) in taken or new_path.exists():
+                new_path = new_dir / f"{old_path.stem} ({counter}){old_path.suffix}"
+                counter += 1
+            if counter > 1:
+                renamed.append(song['id'])
+
+            taken.add(os.path.normcase(str(new_path)))
+            moves.append([song['id'], str(old_path), str(new_path),
+                          stat.st_size, stat.st_mtime_ns])
+
+        return {'pattern': pattern, 'moves': moves, 'renamed': renamed, 'missing': missing}
+
+    def execute(self, plan, workers=None):
+        """Carry out a plan from plan(); returns counts of moved, copied and failed files"""
+        self._write_journal(plan)
+        stats = self._run_moves(plan['moves'], workers)
+        self.journal_path.unlink()
+        return stats
+
+    def resume(self, workers=None):
+        """Finish a plan left in the journal by an interrupted run"""
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                plan = json.load(journal)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Torn journal: nothing had been moved when it was written
+            self.journal_path.unlink()
+            return None
+
+        logger.info(f"Resuming interrupted organize of {len(plan['moves'])} songs")
+        stats = self._run_moves(plan['moves'], workers)
+        self.journal_path.unlink()
+        return stats
+
+    def _write_journal(self, plan):
+        temp_path = self.journal_path.with_name(self.journal_path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as journal:
+            json.dump(plan, journal)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def _run_moves(self, moves, workers=None):
+        """Move files, then update every moved song in one transaction
+
+        Moves already done by an earlier run (target present) are kept,
+        so running the same moves twice is safe. A target that is not the
+        file the plan recorded (another size or mtime) is someone else's
+        file: the move is skipped as failed and the source is kept.
+        """
+        stats = {'moved': 0, 'copied': 0, 'failed': 0}
+        done = []
+        copies = []
+
+        for song_id, old_path, new_path, size, mtime_ns in moves:
+            try:
+                part_path = new_path + '.part'
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                if os.path.exists(new_path):
+                    if not self._is_moved_file(new_path, size, mtime_ns):
+                        logger.error(f"Not moving {old_path}: {new_path} is a different file")
+                        stats['failed'] += 1
+                        continue
+                    # Finished before an interruption; drop a leftover source
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+                    done.append((song_id, new_path))
+                    continue
+
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                if os.stat(old_path).st_dev == os.stat(os.path.dirname(new_path)).st_dev:
+                    os.rename(old_path, new_path)
+                    stats['moved'] += 1
+                    done.append((song_id, new_path))
+                else:
+                    copies.append((song_id, old_path, new_path))
+            except OSError as e:
+                logger.error(f"Failed to move {old_path}: {e}")
+                stats['failed'] += 1
+
+        if copies:
+            with ThreadPoolExecutor(max_workers=workers or Config.ORGANIZE_COPY_WORKERS) as executor:
+                for song_id, new_path in executor.map(self._copy_file, copies):
+                    if new_path:
+                        stats['copied'] += 1
+                        done.append((song_id, new_path))
+                    else:
+                        stats['failed'] += 1
+
+        fingerprints = []
+        for song_id, new_path in done:
+            stat = os.stat(new_path)
+            fingerprints.append((song_id, new_path, stat.st_size, stat.st_mtime_ns, stat.st_ino))
+        self.db.move_songs(fingerprints, batch_size=max(len(fingerprints), 1))
+
+        logger.info(
+            f"Organized library: {stats['moved']} renamed, {stats['copied']} copied "
+            f"across devices, {stats['failed']} failed"
+        )
+        return stats
+
+    @staticmethod
+    def _is_moved_file(new_path, size, mtime_ns):
+        """Whether new_path has the size and mtime the plan recorded; renames and copy2 keep both"""
+        target = os.stat(new_path)
+        return target.st_size == size and target.st_mtime_ns == mtime_ns
+    
+    def _copy_file(self, move):
+        """Copy to a .part file, swap it in, then remove the source"""
+        song_id, old_path, new_path = move
+        part_path = new_path + '.part'
+        try:
+            shutil.copy2(old_path, part_path)
+            os.replace(part_path, new_path)
+            os.remove(old_path)
+            return song_id, new_path
+        except OSError as e:
+            logger.error(f"Failed to copy {old_path}: {e}")
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return song_id, None
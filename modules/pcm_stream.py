@@ -0,0 +1,84 @@
+import io
+import struct
+import threading
+
+# Largest data chunk a RIFF header can declare, in whole 4-byte frames
+MAX_DATA_SIZE = (0xFFFFFFFF - 36) // 4 * 4
+
+class PcmStream(io.RawIOBase):
+    """A WAV file, read by the mixer, made of decoded PCM played back to back
+    
+    The header declares the largest data chunk a WAV can hold, and reads
+    return whatever PCM has been appended, so the next song can be added
+    while this one plays and its first sample follows this one's last.
+    """
+    
+    def __init__(self, pcm, frequency=44100, sample_size=16, channels=2):
+        super().__init__()
+        frame_size = sample_size // 8 * channels
+        header = struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', MAX_DATA_SIZE + 36, b'WAVE',
+                             b'fmt ', 16, 1, channels, frequency, frequency * frame_size,
+                             frame_size, sample_size, b'data', MAX_DATA_SIZE)
+        self._lock = threading.Lock()
+        # (offset in the file, PCM), in order
+        self._segments = [(0, memoryview(header))]
+        self._end = len(header)
+        self._position = 0
+        self.append(pcm)
+    
+    def append(self, pcm):
+        """Add PCM to play after everything appended so far; returns its offset"""
+        pcm = memoryview(pcm).cast('B')
+        with self._lock:
+            offset = self._end
+            self._segments.append((offset, pcm))
+            self._end += len(pcm)
+        return offset
+    
+    def drop_from(self, offset):
+        """Take back the PCM appended at offset and after, unless reading has reached it"""
+        with self._lock:
+            if self._position > offset:
+                return False
+            self._segments = [segment for segment in self._segments if segment[0] < offset]
+            self._end = offset
+            return True
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, buffer):
+        filled = 0
+        with self._lock:
+            for offset, pcm in self._segments:
+                start = self._position - offset
+                if start < 0 or start >= len(pcm):
+                    continue
+                size = min(len(buffer) - filled, len(pcm) - start)
+                buffer[filled:filled + size] = pcm[start:start + size]
+                filled += size
+                self._position += size
+                if filled == len(buffer):
+                    break
+            if filled:
+                # Segments behind the read position are never read again
+                while self._segments[0][0] + len(self._segments[0][1]) <= self._position:
+                    del self._segments[0]
+                    if not self._segments:
+                        break
+        # Past the PCM appended so far is the end of the stream
+        return filled
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += 44 + MAX_DATA_SIZE
+        self._position = max(offset, 0)
+        return self._position
+    
+    def tell(self):
+        return self._position
@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PlayStatsBuffer:
+    """Write-behind buffer for play counts and last-played stamps
+    
+    Plays are aggregated in memory and appended to a journal file, then
+    written to the database in one transaction by a background thread.
+    The journal is replayed on the next start if the app dies before a
+    flush, so a crash can repeat a flushed batch but never lose one.
+    """
+    
+    def __init__(self, database, journal_path=None,
+                 interval=None, threshold=None):
+        self.db = database
+        self.journal_path = journal_path or Config.STATS_JOURNAL_PATH
+        self.interval = interval or Config.STATS_FLUSH_INTERVAL
+        self.threshold = threshold or Config.STATS_FLUSH_THRESHOLD
+        
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(lambda: [0, ''])
+        self._pending_events = 0
+        self._wake = threading.Event()
+        self._closed = False
+        
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._recover_journal()
+        
+        self._thread = threading.Thread(
+            target=self._run, name="PlayStatsFlusher", daemon=True
+        )
+        self._thread.start()
+    
+    def _recover_journal(self):
+        """Flush plays left in the journal by a previous run"""
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        song_id, played_at = line.rstrip('\n').split('\t')
+                        self._add(int(song_id), played_at)
+                    except ValueError:
+                        # Torn final line from a crash mid-write
+                        continue
+        except FileNotFoundError:
+            return
+        
+        if self._pending_events:
+            logger.info(f"Recovering {self._pending_events} unflushed plays")
+            self.flush()
+    
+    def _add(self, song_id, played_at):
+        entry = self._pending[song_id]
+        entry[0] += 1
+        entry[1] = max(entry[1], played_at)
+        self._pending_events += 1
+    
+    def record_play(self, song_id):
+        """Record that song_id started playing"""
+        played_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        
+        with self._lock:
+            if self._closed:
+                self.db.add_play_counts([(song_id, 1, played_at)])
+                return
+            
+            self._journal.write(f"{song_id}\t{played_at}\n")
+            self._journal.flush()
+            self._add(song_id, played_at)
+            should_flush = self._pending_events >= self.threshold
+        
+        if should_flush:
+            self._wake.set()
+    
+    def flush(self):
+        """Write all pending plays to the database"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending_events:
+                    return 0
+                pending, self._pending = self._pending, defaultdict(lambda: [0, ''])
+                count, self._pending_events = self._pending_events, 0
+            
+            try:
+                self.db.add_play_counts(
+                    (song_id, plays, last_played)
+                    for song_id, (plays, last_played) in pending.items()
+                )
+            except Exception as e:
+                logger.error(f"Failed to flush play stats: {e}")
+                # Put the plays back so the next flush retries them
+                with self._lock:
+                    for song_id, (plays, last_played) in pending.items():
+                        entry = self._pending[song_id]
+                        entry[0] += plays
+                        entry[1] = max(entry[1], last_played)
+                    self._pending_events += count
+                return 0
+            
+            with self._lock:
+                if not self._pending_events:
+                    # Everything journaled is now in the database
+                    self._truncate_journal()
+            
+            return count
+    
+    def _truncate_journal(self):
+        if self._closed:
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+        else:
+            self._journal.seek(0)
+            self._journal.truncate()
+    
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            self.flush()
+    
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._journal.close()
+        
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        
+        with self._lock:
+            if not self._pending_events:
+                self._truncate_journal()
@@ -0,0 +1,319 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from config import Config
+
+_MASK64 = (1 << 64) - 1
+
+def _mix(value):
+    """splitmix64 finaliser: a fast, well-spread 64-bit hash of an integer"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+class ShuffleOrder:
+    """A seeded permutation of range(size), worked out one position at a time
+    
+    A four-round Feistel network over the smallest even bit width that
+    holds size permutes that power-of-two domain; results outside
+    range(size) go through it again until they land inside (cycle
+    walking), which keeps it a permutation of range(size). A lookup is a
+    few integer operations and nothing is stored per song, so a million
+    songs cost no more memory than ten. The same seed and size always
+    give the same order.
+    """
+    ROUNDS = 4
+    
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seed = seed
+        self._half = max((size - 1).bit_length() + 1, 2) // 2
+        self._mask = (1 << self._half) - 1
+        self._keys = [_mix(_mix(seed) + round_number) for round_number in range(self.ROUNDS)]
+    
+    def __len__(self):
+        return self.size
+    
+    def _encrypt(self, value):
+        left, right = value >> self._half, value & self._mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(right ^ key) & self._mask)
+        return (left << self._half) | right
+    
+    def _decrypt(self, value):
+        left, right = value >> self._half, value & self._mask
+        for key in reversed(self._keys):
+            left, right = right ^ (_mix(left ^ key) & self._mask), left
+        return (left << self._half) | right
+    
+    def __getitem__(self, position):
+        """Index of the song played at position"""
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+    
+    def index(self, value):
+        """Position at which the song at index value is played"""
+        if not 0 <= value < self.size:
+            raise ValueError(value)
+        position = self._decrypt(value)
+        while position >= self.size:
+            position = self._decrypt(position)
+        return position
+
+class PlaybackQueue:
+    """What plays next, built once from wherever playback started
+    
+    ids is the context (a library view, playlist or search result) as a
+    compact array of song ids, and cursor is the current song's place in
+    the play order, so moving on or back is a step of the cursor rather
+    than a query and a scan. Songs picked with insert_next() play before
+    the context carries on; history records what actually played, so
+    previous() retraces it. source names the context, letting edits to
+    that playlist be applied to the queue in place.
+    
+    With shuffle on, the play order is a ShuffleOrder of the context
+    rotated to start at the current song, so every other song plays once
+    before any comes round again. When the context changes mid-run, the
+    songs already played keep their places at the head of the order and
+    only the rest is shuffled again. repeat is 'off', 'all' (start the
+    order over at the end) or 'one' (songs that run out play again).
+    """
+    REPEAT_MODES = ('off', 'all', 'one')
+    
+    def __init__(self, song_ids=(), source=None, current=None, shuffle=False, repeat='off'):
+        self.ids = array('q', song_ids)
+        self.source = source
+        self.repeat = repeat
+        self.up_next = deque()
+        self.history = deque(maxlen=Config.QUEUE_HISTORY_SIZE)
+        self.current = None
+        # Whether current is the context song at cursor rather than one from up_next
+        self._in_context = False
+        self.cursor = -1
+        self.shuffle = None
+        self._offset = 0
+        # Indexes played in this run before the context last changed, in
+        # play order; the shuffle covers the other indexes
+        self._played = array('q')
+        self._played_sorted = []
+        if shuffle:
+            self.set_shuffle(True)
+        if current is not None:
+            self.jump(current)
+    
+    def __len__(self):
+        return len(self.ids) + len(self.up_next)
+    
+    def _index(self, position):
+        """Index into ids of the song at a play-order position"""
+        if self.shuffle is None:
+            return position
+        played = len(self._played)
+        if position < played:
+            return self._played[position]
+        return self._unplayed(self.shuffle[(position - played + self._offset) % len(self.shuffle)])
+    
+    def _position(self, index):
+        """Play-order position of the song at an index into ids"""
+        if self.shuffle is None or index < 0:
+            return index
+        skipped = bisect_left(self._played_sorted, index)
+        if skipped < len(self._played_sorted) and self._played_sorted[skipped] == index:
+            return self._played.index(index)
+        return len(self._played) + (self.shuffle.index(index - skipped) - self._offset) % len(self.shuffle)
+    
+    def _unplayed(self, rank):
+        """Index into ids of the rank-th song not in _played"""
+        index = rank
+        while True:
+            following = rank + bisect_right(self._played_sorted, index)
+            if following == index:
+                return index
+            index = following
+    
+    def _current_index(self):
+        return self._index(self.cursor) if self.cursor >= 0 else -1
+    
+    def _deal(self, index):
+        """Shuffle the context, starting the order at ids[index]"""
+        self._played = array('q')
+        self._played_sorted = []
+        self.shuffle = ShuffleOrder(len(self.ids), Config.SHUFFLE_SEED)
+        if 0 <= index < len(self.ids):
+            self._offset = self.shuffle.index(index)
+            self.cursor = 0
+        else:
+            self._offset = 0
+            self.cursor = -1
+    
+    def _redeal(self, played):
+        """Shuffle the context again after it changed, keeping the indexes played so far first"""
+        self._played = array('q', played)
+        self._played_sorted = sorted(played)
+        self.shuffle = ShuffleOrder(len(self.ids) - len(played), Config.SHUFFLE_SEED)
+        self._offset = 0
+        self.cursor = len(played) - 1
+    
+    def _run(self):
+        """Indexes played so far in this run through the order"""
+        return [self._index(position) for position in range(self.cursor + 1)]
+    
+    def _remember(self):
+        """Push the current song onto the history"""
+        if self.current is not None:
+            self.history.append((self.current, self._current_index(), self._in_context))
+    
+    def set_shuffle(self, enabled):
+        """Turn shuffle on or off; the current song stays current"""
+        index = self._current_index()
+        if enabled:
+            self._deal(index)
+        else:
+            self.shuffle = None
+            self.cursor = index
+    
+    def jump(self, song_id):
+        """Make song_id current, at its place in the context if it has one"""
+        self._remember()
+        
+        self.current = song_id
+        if 0 <= self.cursor < len(self.ids) and self.ids[self._index(self.cursor)] == song_id:
+            self._in_context = True
+            return
+        try:
+            index = self.ids.index(song_id)
+        except ValueError:
+            self._in_context = False
+            return
+        
+        self._in_context = True
+        if self.shuffle is None:
+            self.cursor = index
+        else:
+            # A song picked by hand starts a new run through the shuffle
+            self._deal(index)
+    
+    def _next_position(self):
+        if self.cursor + 1 < len(self.ids):
+            return self.cursor + 1
+        if self.repeat == 'all' and self.ids:
+            return 0
+        return None
+    
+    def peek_next(self, auto=False):
+        """The song next() would move to, without moving
+        
+        auto means the current song ran out rather than Next being
+        pressed, which is when repeat 'one' plays it again.
+        """
+        if auto and self.repeat == 'one' and self.current is not None:
+            return self.current
+        if self.up_next:
+            return self.up_next[0]
+        position = self._next_position()
+        return None if position is None else self.ids[self._index(position)]
+    
+    def next(self, auto=False):
+        """Move to the next song and return its id, or None at the end"""
+        if auto and self.repeat == 'one' and self.current is not None:
+            return self.current
+        
+        position = None
+        if self.up_next:
+            song_id = self.up_next.popleft()
+        else:
+            position = self._next_position()
+            if position is None:
+                return None
+            song_id = self.ids[self._index(position)]
+        
+        self._remember()
+        if position is not None:
+            self.cursor = position
+        self.current = song_id
+        self._in_context = position is not None
+        return song_id
+    
+    def previous(self):
+        """Go back to the song played before this one and return its id, or None"""
+        if self.history:
+            song_id, index, in_context = self.history.pop()
+            cursor = self._position(index)
+        elif self._in_context and self.cursor > 0:
+            cursor = self.cursor - 1
+            song_id, in_context = self.ids[self._index(cursor)], True
+        else:
+            return None
+        
+        if self.current is not None and not self._in_context:
+            # A queued song played out of turn comes round again on next()
+            self.up_next.appendleft(self.current)
+        self.current = song_id
+        self.cursor = cursor
+        self._in_context = in_context
+        return song_id
+    
+    def insert_next(self, song_ids):
+        """Play song_ids, in order, straight after the current song"""
+        self.up_next.extendleft(reversed(list(song_ids)))
+    
+    def append(self, song_ids):
+        """Add song_ids to the end of the context
+        
+        A shuffled context deals them in among the songs still to play.
+        """
+        played = self._run() if self.shuffle is not None else None
+        self.ids.extend(song_ids)
+        if played is not None:
+            self._redeal(played)
+    
+    def remove(self, song_ids):
+        """Drop song_ids everywhere in the queue; the current song keeps playing
+        
+        A shuffled context is dealt again, like append() does, without
+        the songs already played.
+        """
+        removed = set(song_ids)
+        if not removed:
+            return
+        
+        indexes = []
+        for song_id in removed:
+            index = -1
+            try:
+                while True:
+                    index = self.ids.index(song_id, index + 1)
+                    indexes.append(index)
+            except ValueError:
+                pass
+        indexes.sort()
+        
+        def shift(index):
+            # Removing the row an index is on leaves it on the row before
+            return index - bisect_right(indexes, index)
+        
+        current_index = shift(self._current_index())
+        played = self._run() if self.shuffle is not None and indexes else None
+        for index in reversed(indexes):
+            del self.ids[index]
+        
+        if self.current in removed:
+            # Still playing, but gone from the queue: nothing to come back to
+            self.current = None
+            self._in_context = False
+        if self.shuffle is None:
+            self.cursor = current_index
+        elif played is not None:
+            gone = set(indexes)
+            self._redeal([shift(index) for index in played if index not in gone])
+        self.up_next = deque(song_id for song_id in self.up_next if song_id not in removed)
+        self.history = deque(
+            ((song_id, shift(index), in_context)
+             for song_id, index, in_context in self.history if song_id not in removed),
+            maxlen=self.history.maxlen
+        )
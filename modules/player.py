@@ -1,57 +1,47 @@
 import pygame
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import time
 from config import Config
+from modules.pcm_stream import PcmStream
+from modules.play_stats import PlayStatsBuffer
+from modules.tag_reader import TagReader
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Samples an MP3 decoder outputs before the first encoded one (528 + 1)
+MP3_DECODER_DELAY = 529
+
 class MusicPlayer:
     def __init__(self, database):
         pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+        # Length of one mixer buffer in ms of the mixer clock
+        self._buffer_ms = 4096 * 1000 / 44100
         self.db = database
+        self.stats = PlayStatsBuffer(database)
         self.current_song = None
         self._is_playing = False
         self.paused_position = 0
         self.length = 0
-        self.start_time = 0
+        # Position = _clock_position + mixer ms elapsed since _clock_ticks,
+        # the mixer clock reading at which _clock_position reaches the output
+        self._clock_position = 0
+        self._clock_ticks = 0
+        self._start_position = 0
+        # Decoded PCM of the current song and the stream playing it
+        self._pcm = None
+        self._stream = None
+        # (song, filepath, stat, probe, future of its PCM) of the song to follow this one
+        self._next = None
+        # (stream, offset) where the next song's PCM was appended
+        self._queued = None
+        self._lock = threading.Lock()
+        self._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Decoder")
         self.volume = Config.DEFAULT_VOLUME
         self.current_song_id = None
         self.audio = None  # For tracking playback
-    def _get_audio_duration(self, filepath):
-        """Get audio duration using multiple methods"""
-        try:
-            # Try mutagen first
-            try:
-                from mutagen.mp3 import MP3
-                if filepath.suffix.lower() == '.mp3':
-                    audio = MP3(filepath)
-                    return audio.info.length
-            except:
-                pass
-            
-            # Try using a simpler method: file size estimation
-            try:
-                file_size = filepath.stat().st_size
-                # Rough estimate for MP3: 1MB ≈ 1 minute at 128kbps
-                # More accurate: (file_size * 8) / (bitrate * 1000)
-                if filepath.suffix.lower() == '.mp3':
-                    # Assume 128kbps for MP3
-                    bitrate = 128000  # bits per second
-                    estimated_seconds = (file_size * 8) / bitrate
-                    return estimated_seconds
-                else:
-                    # Default estimate
-                    estimated_minutes = file_size / (1024 * 1024)
-                    return estimated_minutes * 60
-            except:
-                pass
-            
-        except:
-            pass
-        
-        return 180  # Default 3 minutes
     def load_song(self, song_id):
         """Load a song by ID"""
         song = self.db.get_song(song_id)
@@ -60,33 +50,38 @@ class MusicPlayer:
             return False
         
         filepath = Path(song['filepath'])
-        if not filepath.exists():
+        try:
+            stat = filepath.stat()
+        except OSError:
             logger.error(f"File not found: {filepath}")
             return False
         
+        if song['missing']:
+            # Flagged by a prune pass, but the file is back
+            self.db.mark_missing_songs((), [song_id])
+        
+        probe = self.db.get_file_probe(filepath, stat.st_size, stat.st_mtime_ns)
+        if probe and not probe['playable']:
+            logger.error(f"Cannot play {filepath}: unsupported {probe['codec'] or 'format'}")
+            return False
+        
         try:
-            # First, verify file can be loaded
             try:
-                pygame.mixer.music.load(str(filepath))
-                pygame.mixer.music.unload()  # Unload after testing
+                pcm = self._decode(filepath)
             except pygame.error as e:
                 logger.error(f"Pygame cannot load file {filepath}: {e}")
                 # Try alternative loading method
-                if not self._try_alternative_load(filepath):
+                pcm = self._try_alternative_load(filepath)
+                if pcm is None:
+                    self._save_probe(filepath, stat, False)
                     return False
             
-            self.current_song = filepath
-            self.current_song_id = song_id
+            # The song playing until now stops here, as a mixer load would
+            self._unload()
+            self._loaded(song, filepath, stat, probe, pcm)
             self._is_playing = False
             self.paused_position = 0
-            
-            # Get duration from database or file
-            if song['duration'] and song['duration'] > 0:
-                self.length = song['duration']
-            else:
-                self.length = self._get_audio_duration(filepath)
-                # Update database with actual duration
-                self.db.update_song(song_id, duration=self.length)
+            self._start_position = 0
             
             # Set volume
             pygame.mixer.music.set_volume(self.volume / 100.0)
@@ -98,18 +93,156 @@ class MusicPlayer:
             logger.error(f"Error loading song {filepath}: {e}")
             return False
     
+    def _save_probe(self, filepath, stat, playable, duration=0):
+        """Remember whether the mixer could open this version of the file"""
+        try:
+            codec = TagReader.codec(filepath)
+        except OSError:
+            codec = None
+        self.db.set_file_probe(filepath, stat.st_size, stat.st_mtime_ns, playable, codec, duration)
+    
+    def _decode(self, filepath):
+        """Decode a file to PCM in the mixer's format, without encoder delay or padding"""
+        pcm = pygame.mixer.Sound(str(filepath)).get_raw()
+        if filepath.suffix.lower() == '.mp3':
+            pcm = self._trim_encoder_delay(filepath, pcm)
+        return pcm
+    
+    def _trim_encoder_delay(self, filepath, pcm):
+        """Cut the LAME/Xing encoder delay and padding if the decoder left them in"""
+        try:
+            gapless = TagReader.mp3_gapless(filepath)
+        except OSError:
+            gapless = None
+        if not gapless:
+            return pcm
+        
+        samples, delay, padding, sample_rate = gapless
+        frequency, bits, channels = self._mixer_format()
+        frame_size = bits // 8 * channels
+        scale = frequency / sample_rate
+        decoded = len(pcm) // frame_size
+        audible = round((samples - delay - padding) * scale)
+        # Decoders that honor the header return the audible samples only
+        if abs(decoded - audible) <= abs(decoded - samples * scale):
+            return pcm
+        start = round((delay + MP3_DECODER_DELAY) * scale) * frame_size
+        return pcm[start:start + audible * frame_size]
+    
+    def _mixer_format(self):
+        """(frequency, bits per sample, channels) of the PCM the mixer plays"""
+        frequency, size, channels = pygame.mixer.get_init()
+        return frequency, abs(size) & 0xFF, channels
+    
+    def _loaded(self, song, filepath, stat, probe, pcm):
+        """Make a decoded song the current one"""
+        self.current_song = filepath
+        self.current_song_id = song['id']
+        self._pcm = pcm
+        frequency, bits, channels = self._mixer_format()
+        self.length = len(pcm) / (bits // 8 * channels) / frequency
+        if not song['duration']:
+            self.db.update_song(song['id'], duration=self.length)
+        if probe is None:
+            self._save_probe(filepath, stat, True, self.length)
+    
+    def preload_next(self, song_id):
+        """Decode song_id in the background and append it to the stream after the current song"""
+        if not self.current_song or not (self._is_playing or self.paused_position):
+            return False
+        if self._next and self._next[0]['id'] == song_id:
+            return True
+        
+        song = self.db.get_song(song_id)
+        if not song:
+            return False
+        
+        filepath = Path(song['filepath'])
+        try:
+            stat = filepath.stat()
+        except OSError:
+            return False
+        
+        probe = self.db.get_file_probe(filepath, stat.st_size, stat.st_mtime_ns)
+        if probe and not probe['playable']:
+            return False
+        
+        with self._lock:
+            if self._queued and not self._queued[0].drop_from(self._queued[1]):
+                # Already being read: the song appended before stays next
+                return False
+            self._queued = None
+            if self._next:
+                self._next[4].cancel()
+            future = self._decoder.submit(self._decode, filepath)
+            self._next = (song, filepath, stat, probe, future)
+        future.add_done_callback(self._next_decoded)
+        logger.info(f"Decoding next song: {song['title']}")
+        return True
+    
+    def _next_decoded(self, future):
+        """Append the next song to the stream as soon as it is decoded"""
+        with self._lock:
+            if self._next and self._next[4] is future:
+                self._append_next()
+    
+    def _append_next(self):
+        """Append the decoded next song after the current one, once; needs the lock"""
+        future = self._next[4]
+        if not self._stream or (self._queued and self._queued[0] is self._stream):
+            return
+        if not future.done() or future.cancelled() or future.exception():
+            return
+        self._queued = (self._stream, self._stream.append(future.result()))
+    
+    def poll(self):
+        """Notice a switch to the preloaded song; returns True when it has started"""
+        if not self._next or not self._is_playing:
+            return False
+        
+        song, filepath, stat, probe, future = self._next
+        ticks = pygame.mixer.music.get_pos()
+        if ticks < 0:
+            # The stream ran out before the next song was decoded
+            if not future.done():
+                return False
+            if future.exception():
+                logger.error(f"Cannot decode {filepath}: {future.exception()}")
+                self._save_probe(filepath, stat, False)
+                self._next = None
+                return False
+            gapless = False
+        elif self._queued and self._position_at(ticks, clamp=False) >= self.length:
+            gapless = True
+        else:
+            return False
+        
+        # The next song's first sample follows the last one of this song
+        self._clock_ticks += (self.length - self._clock_position) * 1000
+        self._clock_position = 0
+        with self._lock:
+            self._next = None
+            self._queued = None
+        self._loaded(song, filepath, stat, probe, future.result())
+        if not gapless:
+            self._start_at(0)
+        self.stats.record_play(self.current_song_id)
+        logger.info(f"Started playing: {self.current_song.name}")
+        return True
+    
     def _try_alternative_load(self, filepath):
         """Try alternative methods to load problematic audio files"""
         try:
             # Try different buffer size
+            self._unload()
             pygame.mixer.quit()
             pygame.mixer.init(frequency=22050, buffer=2048)
+            self._buffer_ms = 2048 * 1000 / 22050
             
             # Try loading again
-            pygame.mixer.music.load(str(filepath))
-            return True
+            return self._decode(filepath)
         except:
-            return False
+            return None
     
     def play(self):
         """Start or resume playback"""
@@ -121,27 +254,23 @@ class MusicPlayer:
             if self._is_playing:
                 return True
             
-            if self.paused_position > 0:
-                # For pygame, we need to reload and seek
-                pygame.mixer.music.load(str(self.current_song))
-                pygame.mixer.music.play()
-                # Seek to paused position
-                if self.paused_position > 0:
-                    time.sleep(0.1)  # Small delay
-                    # Note: pygame doesn't support precise seeking, 
-                    # so we'll track time manually
-                    self.start_time = time.time() - self.paused_position
+            resuming = self.paused_position > 0
+            
+            if resuming and self._stream:
+                # The stream kept its place, so carry on from there
+                pygame.mixer.music.unpause()
+                self._anchor(self.paused_position)
             else:
-                pygame.mixer.music.load(str(self.current_song))
-                pygame.mixer.music.play()
-                self.start_time = time.time()
+                # Fresh start, or a seek made while paused
+                self._start_at(self._start_position)
+                self._start_position = 0
             
             self._is_playing = True
             self.paused_position = 0
             
-            # Update play count
-            if self.current_song_id:
-                self.db.increment_play_count(self.current_song_id)
+            # Update play count (buffered, only for a fresh start)
+            if self.current_song_id and not resuming:
+                self.stats.record_play(self.current_song_id)
             
             logger.info(f"Started playing: {self.current_song.name}")
             return True
@@ -150,15 +279,54 @@ class MusicPlayer:
             logger.error(f"Play error: {e}")
             return False
     
+    def _start_at(self, position):
+        """Play the current song's PCM from position seconds, with the next song's after it"""
+        frequency, bits, channels = self._mixer_format()
+        frame_size = bits // 8 * channels
+        frame = min(round(position * frequency), len(self._pcm) // frame_size)
+        stream = PcmStream(memoryview(self._pcm)[frame * frame_size:], frequency, bits, channels)
+        with self._lock:
+            self._stream = stream
+            self._queued = None
+            if self._next:
+                self._append_next()
+        pygame.mixer.music.load(stream, 'wav')
+        pygame.mixer.music.play()
+        self._anchor(frame / frequency)
+    
+    def _anchor(self, position):
+        """Tie position seconds into the track to the next mixer buffer
+        
+        The mixer clock counts whole buffers as they are handed to the
+        device, plus the time since. A start, seek or resume takes effect
+        in the next buffer filled, so that is where position begins to
+        be heard.
+        """
+        ticks = max(pygame.mixer.music.get_pos(), 0)
+        self._clock_position = position
+        self._clock_ticks = self._next_buffer(ticks)
+    
+    def _next_buffer(self, ticks):
+        """Mixer clock reading at which the buffer after the one playing at ticks starts"""
+        # get_pos() truncates to whole ms, so a reading can be just short of a boundary
+        return (int((ticks + 1) / self._buffer_ms) + 1) * self._buffer_ms
+    
+    def _position_at(self, ticks, clamp=True):
+        """Track position heard when the mixer clock reads ticks"""
+        position = self._clock_position + max(ticks - self._clock_ticks, 0) / 1000.0
+        return max(0, min(position, self.length)) if clamp else position
+    
     def pause(self):
         """Pause playback"""
         try:
             if self._is_playing:
+                # The buffer already handed over plays out, and the
+                # decoder carries on from its end when resumed
+                ticks = pygame.mixer.music.get_pos()
+                position = self._position_at(self._next_buffer(ticks)) if ticks >= 0 else self.length
                 pygame.mixer.music.pause()
                 self._is_playing = False
-                # Calculate paused position
-                if self.start_time > 0:
-                    self.paused_position = time.time() - self.start_time
+                self.paused_position = max(position, 0.001)
                 logger.info("Playback paused")
                 return True
             return False
@@ -171,8 +339,8 @@ class MusicPlayer:
         try:
             if not self._is_playing and self.paused_position > 0:
                 pygame.mixer.music.unpause()
+                self._anchor(self.paused_position)
                 self._is_playing = True
-                self.start_time = time.time() - self.paused_position
                 self.paused_position = 0
                 logger.info("Playback unpaused")
                 return True
@@ -184,14 +352,26 @@ class MusicPlayer:
     def stop(self):
         """Stop playback"""
         try:
-            pygame.mixer.music.stop()
+            self._unload()
             self._is_playing = False
             self.paused_position = 0
-            self.start_time = 0
+            self._start_position = 0
+            self._clock_position = 0
+            self._clock_ticks = 0
             logger.info("Playback stopped")
         except Exception as e:
             logger.error(f"Stop error: {e}")
     
+    def _unload(self):
+        """Stop the stream and drop the song decoded to follow"""
+        pygame.mixer.music.stop()
+        with self._lock:
+            if self._next:
+                self._next[4].cancel()
+            self._stream = None
+            self._next = None
+            self._queued = None
+    
     def set_volume(self, volume):
         """Set volume (0-100)"""
         try:
@@ -201,16 +381,26 @@ class MusicPlayer:
             logger.error(f"Volume error: {e}")
     
     def get_position(self):
-        """Get current position in seconds"""
+        """Get current position in seconds
+        
+        Measured with the mixer's clock (samples played), so it cannot
+        drift from the audio the way wall-clock time does. Right after a
+        seek it holds the new position until the buffer carrying it
+        starts playing.
+        """
         try:
-            if not self._is_playing:
+            if self.paused_position:
                 return self.paused_position
+            if not self._is_playing:
+                return self._start_position
             
-            if self.start_time > 0:
-                elapsed = time.time() - self.start_time
-                return min(elapsed, self.length)
-            return 0
-        except:
+            ticks = pygame.mixer.music.get_pos()
+            if ticks < 0:
+                # Music has finished
+                return self.length
+            
+            return self._position_at(ticks)
+        except pygame.error:
             return 0
     
     def set_position(self, position):
@@ -219,23 +409,15 @@ class MusicPlayer:
             if position < 0 or position > self.length:
                 return False
             
-            was_playing = self._is_playing
-            
-            if was_playing:
-                pygame.mixer.music.stop()
-            
-            self.paused_position = position
-            
-            if was_playing:
-                # Reload and play from position
-                pygame.mixer.music.load(str(self.current_song))
-                pygame.mixer.music.play()
-                # We'll track the start time to simulate seeking
-                self.start_time = time.time() - position
-                self._is_playing = True
-                self.paused_position = 0
+            if not self._is_playing:
+                # Stopped or paused: start from here on the next play()
+                self._start_position = position
+                if self.paused_position:
+                    pygame.mixer.music.stop()
+                    self._stream = None
+                    self.paused_position = max(position, 0.001)
             else:
-                self._is_playing = False
+                self._start_at(position)
             
             logger.info(f"Seeked to position: {position}s")
             return True
@@ -0,0 +1,397 @@
+import os
+import struct
+from pathlib import Path
+import logging
+from mutagen.mp3 import MP3
+from mutagen.id3 import ID3
+
+logger = logging.getLogger(__name__)
+
+# Largest single metadata block read into memory (cover art is skipped)
+MAX_BLOCK_SIZE = 1024 * 1024
+# How far from the end of an Ogg file to look for the last page
+OGG_TAIL_SIZE = 64 * 1024
+
+class TagReader:
+    @staticmethod
+    def read(file_path):
+        """Read duration and tags for any supported format without decoding audio"""
+        suffix = Path(file_path).suffix.lower()
+        reader = {
+            '.mp3': TagReader.read_mp3,
+            '.flac': TagReader.read_flac,
+            '.m4a': TagReader.read_mp4,
+            '.mp4': TagReader.read_mp4,
+            '.ogg': TagReader.read_ogg,
+            '.opus': TagReader.read_ogg,
+            '.wav': TagReader.read_wav,
+        }.get(suffix)
+        
+        if reader is None:
+            return TagReader.basic_metadata(file_path)
+        return reader(file_path)
+    
+    @staticmethod
+    def codec(file_path):
+        """Name the codec from the first bytes of the stream: mp3, flac, vorbis, opus, wav, mp4 or None"""
+        with open(file_path, 'rb') as fileobj:
+            TagReader._skip_id3v2(fileobj)
+            head = fileobj.read(64)
+        
+        if head.startswith(b'fLaC'):
+            return 'flac'
+        if head.startswith(b'OggS'):
+            # The first packet starts after the 27-byte page header and lacing
+            packet = head[27 + head[26]:] if len(head) > 26 else b''
+            if packet.startswith(b'OpusHead'):
+                return 'opus'
+            if packet.startswith(b'\x01vorbis'):
+                return 'vorbis'
+            return None
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            return 'wav'
+        if head[4:8] == b'ftyp':
+            return 'mp4'
+        if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+            return 'mp3'
+        return None
+    
+    @staticmethod
+    def basic_metadata(file_path):
+        """Metadata derived from the file name alone"""
+        return {
+            'title': Path(file_path).stem[:200],
+            'artist': 'Unknown',
+            'album': '',
+            'duration': 0,
+            'bitrate': 0
+        }
+    
+    @staticmethod
+    def _finish(metadata):
+        """Apply the column length limits"""
+        metadata['title'] = metadata['title'][:200]
+        metadata['artist'] = metadata['artist'][:100]
+        metadata['album'] = metadata['album'][:100]
+        return metadata
+    
+    @staticmethod
+    def read_mp3(file_path):
+        """Read stream info and ID3 tags from one open of an MP3 file
+        
+        The MPEG stream and the ID3 tag are parsed from the same file
+        handle. If the stream cannot be parsed, the tag is still read from
+        that handle, so a damaged file costs one open instead of three.
+        """
+        file_path = Path(file_path)
+        metadata = TagReader.basic_metadata(file_path)
+        
+        with open(file_path, 'rb') as fileobj:
+            tags = None
+            try:
+                audio = MP3(fileobj)
+                tags = audio.tags
+                metadata['duration'] = audio.info.length
+                metadata['bitrate'] = getattr(audio.info, 'bitrate', 0) // 1000  # kbps
+            except Exception as e:
+                logger.warning(f"MP3 stream info unreadable for {file_path}: {e}")
+                try:
+                    fileobj.seek(0)
+                    tags = ID3(fileobj)
+                except Exception:
+                    pass
+            
+            if tags is not None:
+                for key, frame_id in (('title', 'TIT2'), ('artist', 'TPE1'), ('album', 'TALB')):
+                    frame = tags.get(frame_id)
+                    if frame is not None and frame.text:
+                        metadata[key] = str(frame.text[0])
+        
+        return TagReader._finish(metadata)
+    
+    @staticmethod
+    def mp3_gapless(file_path):
+        """Read (samples, delay, padding, sample_rate) from a LAME/Xing header, or None"""
+        with open(file_path, 'rb') as fileobj:
+            TagReader._skip_id3v2(fileobj)
+            frame = fileobj.read(4 + 32 + 120 + 24)
+        
+        if len(frame) < 4 or frame[0] != 0xFF or frame[1] & 0xE0 != 0xE0:
+            return None
+        version = (frame[1] >> 3) & 0x03  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+        rate_index = (frame[2] >> 2) & 0x03
+        if version == 1 or rate_index == 3 or (frame[1] >> 1) & 0x03 != 1:
+            return None  # reserved, or not Layer III
+        sample_rate = (44100, 48000, 32000)[rate_index] >> {3: 0, 2: 1, 0: 2}[version]
+        mono = frame[3] >> 6 == 3
+        # The Xing tag follows the side information in the first frame
+        if version == 3:
+            offset, frame_samples = (21 if mono else 36), 1152
+        else:
+            offset, frame_samples = (13 if mono else 21), 576
+        
+        if frame[offset:offset + 4] not in (b'Xing', b'Info'):
+            return None
+        flags = int.from_bytes(frame[offset + 4:offset + 8], 'big')
+        if not flags & 0x01:
+            return None
+        frames = int.from_bytes(frame[offset + 8:offset + 12], 'big')
+        # Optional byte count, seek table and quality come before the LAME tag
+        lame = offset + 12
+        lame += (4 if flags & 0x02 else 0) + (100 if flags & 0x04 else 0) + (4 if flags & 0x08 else 0)
+        if frame[lame:lame + 4] not in (b'LAME', b'Lavc', b'Lavf') or len(frame) < lame + 24:
+            return None
+        packed = int.from_bytes(frame[lame + 21:lame + 24], 'big')
+        return frames * frame_samples, packed >> 12, packed & 0xFFF, sample_rate
+    
+    @staticmethod
+    def _apply_vorbis_comments(metadata, data):
+        """Fill title/artist/album from a Vorbis comment block"""
+        vendor_length = struct.unpack_from('<I', data, 0)[0]
+        offset = 4 + vendor_length
+        count = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        
+        fields = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album'}
+        seen = set()
+        for _ in range(count):
+            if offset + 4 > len(data):
+                break
+            length = struct.unpack_from('<I', data, offset)[0]
+            comment = data[offset + 4:offset + 4 + length].decode('utf-8', 'replace')
+            offset += 4 + length
+            
+            key, _, value = comment.partition('=')
+            key = fields.get(key.upper())
+            if key and value and key not in seen:
+                metadata[key] = value
+                seen.add(key)
+    
+    @staticmethod
+    def _set_bitrate(metadata, file_path):
+        """Average bitrate in kbps from file size and duration"""
+        if metadata['duration'] > 0:
+            size = os.path.getsize(file_path)
+            metadata['bitrate'] = int(size * 8 / metadata['duration'] / 1000)
+    
+    @staticmethod
+    def _skip_id3v2(fileobj):
+        """Position fileobj after a leading ID3v2 tag, if there is one"""
+        header = fileobj.read(10)
+        if len(header) == 10 and header[:3] == b'ID3':
+            size = 0
+            for byte in header[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            footer = 10 if header[5] & 0x10 else 0
+            fileobj.seek(10 + size + footer)
+        else:
+            fileobj.seek(0)
+    
+    @staticmethod
+    def read_flac(file_path):
+        """Read STREAMINFO and Vorbis comments from the FLAC metadata blocks"""
+        metadata = TagReader.basic_metadata(file_path)
+        
+        with open(file_path, 'rb') as fileobj:
+            TagReader._skip_id3v2(fileobj)
+            if fileobj.read(4) != b'fLaC':
+                raise ValueError("not a FLAC stream")
+            
+            last = False
+            while not last:
+                header = fileobj.read(4)
+                if len(header) < 4:
+                    break
+                last = bool(header[0] & 0x80)
+                block_type = header[0] & 0x7F
+                length = int.from_bytes(header[1:4], 'big')
+                
+                if block_type == 0:
+                    info = fileobj.read(length)
+                    packed = int.from_bytes(info[10:18], 'big')
+                    sample_rate = packed >> 44
+                    total_samples = packed & 0xFFFFFFFFF
+                    if sample_rate:
+                        metadata['duration'] = total_samples / sample_rate
+                elif block_type == 4 and length <= MAX_BLOCK_SIZE:
+                    TagReader._apply_vorbis_comments(metadata, fileobj.read(length))
+                else:
+                    fileobj.seek(length, os.SEEK_CUR)
+        
+        TagReader._set_bitrate(metadata, file_path)
+        return TagReader._finish(metadata)
+    
+    @staticmethod
+    def _mp4_atoms(fileobj, start, end):
+        """Yield (type, data start, data end) for the atoms between start and end"""
+        offset = start
+        while offset + 8 <= end:
+            fileobj.seek(offset)
+            header = fileobj.read(8)
+            if len(header) < 8:
+                return
+            size, atom_type = struct.unpack('>I4s', header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', fileobj.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = end - offset
+            if size < header_size:
+                return
+            yield atom_type, offset + header_size, min(offset + size, end)
+            offset += size
+    
+    @staticmethod
+    def read_mp4(file_path):
+        """Read the movie header and iTunes tags from the MP4 moov atom"""
+        metadata = TagReader.basic_metadata(file_path)
+        fields = {b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album'}
+        
+        with open(file_path, 'rb') as fileobj:
+            file_size = os.fstat(fileobj.fileno()).st_size
+            
+            def find(start, end, path):
+                for atom_type, data_start, data_end in TagReader._mp4_atoms(fileobj, start, end):
+                    if atom_type == path[0]:
+                        if len(path) == 1:
+                            return data_start, data_end
+                        # meta is a full atom: version and flags come first
+                        skip = 4 if atom_type == b'meta' else 0
+                        return find(data_start + skip, data_end, path[1:])
+                return None
+            
+            moov = find(0, file_size, [b'moov'])
+            if moov is None:
+                raise ValueError("no moov atom")
+            
+            mvhd = find(moov[0], moov[1], [b'mvhd'])
+            if mvhd:
+                fileobj.seek(mvhd[0])
+                data = fileobj.read(32)
+                if data[0] == 1:
+                    timescale, duration = struct.unpack_from('>IQ', data, 20)
+                else:
+                    timescale, duration = struct.unpack_from('>II', data, 12)
+                if timescale:
+                    metadata['duration'] = duration / timescale
+            
+            ilst = find(moov[0], moov[1], [b'udta', b'meta', b'ilst'])
+            if ilst:
+                for atom_type, data_start, data_end in TagReader._mp4_atoms(fileobj, *ilst):
+                    key = fields.get(atom_type)
+                    if not key or data_end - data_start > MAX_BLOCK_SIZE:
+                        continue
+                    value = find(data_start, data_end, [b'data'])
+                    if value and value[1] - value[0] > 8:
+                        fileobj.seek(value[0] + 8)  # type indicator and locale
+                        text = fileobj.read(value[1] - value[0] - 8)
+                        metadata[key] = text.decode('utf-8', 'replace')
+        
+        TagReader._set_bitrate(metadata, file_path)
+        return TagReader._finish(metadata)
+    
+    @staticmethod
+    def _ogg_packets(data):
+        """Yield complete packets from the Ogg pages at the start of data"""
+        packet = b''
+        offset = 0
+        while offset + 27 <= len(data) and data[offset:offset + 4] == b'OggS':
+            segments = data[offset + 26]
+            lacing = data[offset + 27:offset + 27 + segments]
+            offset += 27 + segments
+            for length in lacing:
+                packet += data[offset:offset + length]
+                offset += length
+                if length < 255:
+                    yield packet
+                    packet = b''
+    
+    @staticmethod
+    def read_ogg(file_path):
+        """Read Vorbis or Opus headers and the last page's granule position"""
+        metadata = TagReader.basic_metadata(file_path)
+        
+        with open(file_path, 'rb') as fileobj:
+            head = fileobj.read(MAX_BLOCK_SIZE)
+            packets = TagReader._ogg_packets(head)
+            
+            ident = next(packets, b'')
+            if ident.startswith(b'\x01vorbis'):
+                sample_rate = struct.unpack_from('<I', ident, 12)[0]
+                pre_skip = 0
+                comment_magic = b'\x03vorbis'
+            elif ident.startswith(b'OpusHead'):
+                # Opus granule positions always count 48 kHz samples
+                sample_rate = 48000
+                pre_skip = struct.unpack_from('<H', ident, 10)[0]
+                comment_magic = b'OpusTags'
+            else:
+                raise ValueError("not an Ogg Vorbis or Opus stream")
+            
+            comments = next(packets, b'')
+            if comments.startswith(comment_magic):
+                try:
+                    TagReader._apply_vorbis_comments(metadata, comments[len(comment_magic):])
+                except struct.error:
+                    # Comment packet runs past the bounded read
+                    pass
+            
+            file_size = os.fstat(fileobj.fileno()).st_size
+            fileobj.seek(max(0, file_size - OGG_TAIL_SIZE))
+            tail = fileobj.read(OGG_TAIL_SIZE)
+            last_page = tail.rfind(b'OggS')
+            if last_page >= 0 and last_page + 14 <= len(tail) and sample_rate:
+                granule = struct.unpack_from('<q', tail, last_page + 6)[0]
+                if granule > 0:
+                    metadata['duration'] = max(granule - pre_skip, 0) / sample_rate
+        
+        TagReader._set_bitrate(metadata, file_path)
+        return TagReader._finish(metadata)
+    
+    @staticmethod
+    def read_wav(file_path):
+        """Read the fmt and data chunk headers and LIST/INFO tags of a WAV file"""
+        metadata = TagReader.basic_metadata(file_path)
+        fields = {b'INAM': 'title', b'IART': 'artist', b'IPRD': 'album'}
+        
+        with open(file_path, 'rb') as fileobj:
+            header = fileobj.read(12)
+            if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                raise ValueError("not a RIFF/WAVE file")
+            
+            file_size = os.fstat(fileobj.fileno()).st_size
+            byte_rate = 0
+            data_size = 0
+            offset = 12
+            while offset + 8 <= file_size:
+                fileobj.seek(offset)
+                chunk_id, size = struct.unpack('<4sI', fileobj.read(8))
+                
+                if chunk_id == b'fmt ':
+                    fmt = fileobj.read(min(size, 16))
+                    byte_rate = struct.unpack_from('<I', fmt, 8)[0]
+                elif chunk_id == b'data':
+                    # Streamed files may leave the size unset
+                    data_size = min(size, file_size - offset - 8)
+                elif chunk_id == b'LIST' and size <= MAX_BLOCK_SIZE:
+                    info = fileobj.read(size)
+                    if info[:4] == b'INFO':
+                        position = 4
+                        while position + 8 <= len(info):
+                            sub_id, sub_size = struct.unpack_from('<4sI', info, position)
+                            value = info[position + 8:position + 8 + sub_size]
+                            key = fields.get(sub_id)
+                            if key:
+                                text = value.split(b'\x00', 1)[0].decode('utf-8', 'replace')
+                                if text:
+                                    metadata[key] = text
+                            position += 8 + sub_size + (sub_size & 1)
+                
+                offset += 8 + size + (size & 1)
+            
+            if byte_rate:
+                metadata['duration'] = data_size / byte_rate
+                metadata['bitrate'] = byte_rate * 8 // 1000
+        
+        return TagReader._finish(metadata)
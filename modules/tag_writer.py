@@ -0,0 +1,42 @@
+from pathlib import Path
+import mutagen
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB
+
+# Fields the library keeps in tags, and their ID3 frames
+TAG_FIELDS = {'title': TIT2, 'artist': TPE1, 'album': TALB}
+
+class TagWriter:
+    @staticmethod
+    def write(file_path, fields):
+        """Write title/artist/album to a file's tags through one open handle
+
+        Returns False if the format has no tags we can write (WAV), so the
+        change only lives in the database. Raises on I/O or tag errors.
+        """
+        fields = {key: value for key, value in fields.items() if key in TAG_FIELDS}
+        suffix = Path(file_path).suffix.lower()
+        if not fields or suffix not in ('.mp3', '.flac', '.ogg', '.opus', '.m4a', '.mp4'):
+            return False
+
+        with open(file_path, 'r+b') as fileobj:
+            if suffix == '.mp3':
+                try:
+                    tags = ID3(fileobj)
+                except ID3NoHeaderError:
+                    tags = ID3()
+                for key, value in fields.items():
+                    tags.add(TAG_FIELDS[key](encoding=3, text=value))
+                fileobj.seek(0)
+                tags.save(fileobj)
+                return True
+
+            audio = mutagen.File(fileobj, easy=True)
+            if audio is None:
+                raise ValueError(f"Unrecognised audio file: {file_path}")
+            if audio.tags is None:
+                audio.add_tags()
+            for key, value in fields.items():
+                audio[key] = [value]
+            fileobj.seek(0)
+            audio.save(fileobj)
+            return True
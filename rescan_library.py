@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 import sys
 import os
+import argparse
+import signal
+import threading
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from config import Config
 from database import Database
 from modules.file_manager import FileManager
 
 def main():
+    parser = argparse.ArgumentParser(description="Rescan the music library")
+    parser.add_argument('--batch-size', type=int, default=Config.DB_BATCH_SIZE,
+                        help="songs written per database transaction")
+    parser.add_argument('--workers', type=int, default=Config.SCAN_WORKERS,
+                        help="parallel tag readers (1 reads in-process)")
+    args = parser.parse_args()
+    
     print("Rescanning music library...")
     
     db = Database()
@@ -18,11 +29,30 @@ def main():
     #     cursor.execute("DELETE FROM songs")
     #     conn.commit()
     
+    # Ctrl+C stops the walk; files already read are still saved
+    cancel = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+    
+    def show_progress(progress):
+        print(f"\r  {progress['seen']} files, {progress['parsed']} read, "
+              f"{progress['skipped']} unchanged, {progress['bytes'] / 1e6:.1f} MB, "
+              f"{progress['rate']:.0f} files/s", end='', flush=True)
+    
     # Rescan
-    music_files = file_manager.scan_library()
+    stats = file_manager.scan_library(batch_size=args.batch_size, workers=args.workers,
+                                      cancel=cancel, progress=show_progress)
+    print()
     
-    print(f"Found {len(music_files)} music files")
-    print("Rescan complete!")
+    print(f"Found {stats['seen']} music files")
+    print(f"  {stats['unchanged']} unchanged, {stats['added']} added, {stats['updated']} changed, "
+          f"{stats['moved']} moved, {stats['removed']} removed, {stats['failed']} unreadable")
+    if stats['unlisted']:
+        print(f"  {stats['unlisted']} folders could not be read, their songs were kept")
+    if stats['cancelled']:
+        print("Rescan cancelled, missing files were not removed")
+    else:
+        print("Rescan complete!")
+    db.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Schema written by init_database before migrations existed (user_version 0)
+BASELINE_SCHEMA = '''
+    CREATE TABLE songs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        artist TEXT DEFAULT 'Unknown',
+        album TEXT DEFAULT '',
+        duration INTEGER DEFAULT 0,
+        filepath TEXT UNIQUE NOT NULL,
+        filesize INTEGER DEFAULT 0,
+        bitrate INTEGER DEFAULT 0,
+        added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_played TIMESTAMP,
+        play_count INTEGER DEFAULT 0
+    );
+    CREATE TABLE playlists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        song_count INTEGER DEFAULT 0
+    );
+    CREATE TABLE playlist_songs (
+        playlist_id INTEGER,
+        song_id INTEGER,
+        position INTEGER,
+        added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (playlist_id, song_id),
+        FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
+        FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+    );
+    CREATE INDEX idx_songs_title ON songs(title);
+    CREATE INDEX idx_songs_artist ON songs(artist);
+    CREATE INDEX idx_playlist_songs ON playlist_songs(playlist_id, position);
+'''
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "test.db")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def migrate_to(self, version):
+        """Open the database with only the first version migrations known"""
+        partial = type('PartialDatabase', (Database,), {'MIGRATIONS': Database.MIGRATIONS[:version]})
+        return partial(self.path)
+    
+    def test_each_migration_keeps_query_plans_on_their_indexes(self):
+        # A library big enough for ANALYZE to favour the indexes, as a real one would
+        conn = sqlite3.connect(self.path)
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            'INSERT INTO songs (title, artist, filepath, play_count) VALUES (?, ?, ?, ?)',
+            ((f"Song {i}", f"Artist {i % 20}", f"/music/{i}.mp3", i % 7) for i in range(1000))
+        )
+        conn.executemany(
+            'INSERT INTO playlists (name, song_count) VALUES (?, 100)',
+            ((f"Playlist {i}",) for i in range(10))
+        )
+        conn.executemany(
+            'INSERT INTO playlist_songs (playlist_id, song_id, position) VALUES (?, ?, ?)',
+            ((i // 100 + 1, i + 1, i % 100) for i in range(1000))
+        )
+        conn.commit()
+        conn.close()
+        
+        for version in range(1, len(Database.MIGRATIONS) + 1):
+            with self.subTest(version=version):
+                db = self.migrate_to(version)
+                try:
+                    self.assertEqual(db.get_schema_version(), version)
+                    self.assertEqual(db.check_query_plans(), [])
+                    self.assertEqual(db.get_song(1)['title'], 'Song 0')
+                finally:
+                    db.close()
+    
+    def test_new_database_has_every_migration_and_plan(self):
+        db = Database(self.path)
+        try:
+            self.assertEqual(db.get_schema_version(), len(Database.MIGRATIONS))
+            self.assertEqual(db.check_query_plans(), [])
+        finally:
+            db.close()
+
+class PlaylistPositionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        self.song_ids = [
+            self.db.add_song(f"Song {i}", "Artist", f"/music/{i}.mp3") for i in range(5)
+        ]
+        self.playlist_id = self.db.create_playlist("Test")
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+    
+    def order(self):
+        return list(self.db.get_playlist_song_ids(self.playlist_id))
+    
+    def positions(self):
+        return [song['position'] for song in self.db.get_playlist_songs(self.playlist_id)]
+    
+    def test_reorder_past_end_moves_to_end(self):
+        first, *rest = self.song_ids[:4]
+        self.db.add_songs_to_playlist(self.playlist_id, self.song_ids[:4])
+        
+        self.db.reorder_playlist_song(self.playlist_id, first, 20)
+        
+        self.assertEqual(self.order(), rest + [first])
+        self.assertEqual(len(set(self.positions())), 4)
+    
+    def test_insert_past_end_appends(self):
+        self.db.add_songs_to_playlist(self.playlist_id, self.song_ids[:3])
+        
+        self.db.add_songs_to_playlist(self.playlist_id, [self.song_ids[3]], at=10)
+        
+        self.assertEqual(self.order(), self.song_ids[:4])
+        self.assertEqual(len(set(self.positions())), 4)
+    
+    def test_insert_before_start_prepends(self):
+        self.db.add_songs_to_playlist(self.playlist_id, self.song_ids[:3])
+        
+        self.db.add_songs_to_playlist(self.playlist_id, [self.song_ids[3]], at=-2)
+        
+        self.assertEqual(self.order(), [self.song_ids[3]] + self.song_ids[:3])
+        self.assertEqual(len(set(self.positions())), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import Database
+from modules.file_manager import FileManager
+
+class PruneMissingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "library"
+        self.album = self.root / "Album"
+        self.album.mkdir(parents=True)
+        self.library_dirs = Config.LIBRARY_DIRS
+        Config.LIBRARY_DIRS = [self.root]
+        
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        self.file_manager = FileManager(self.db)
+        self.paths = [self.album / f"{i}.mp3" for i in range(3)]
+        for path in self.paths:
+            path.write_bytes(b'')
+        self.song_ids = [self.db.add_song(path.stem, "Artist", str(path)) for path in self.paths]
+        self.playlist_id = self.db.create_playlist("Test")
+        self.db.add_songs_to_playlist(self.playlist_id, self.song_ids)
+    
+    def tearDown(self):
+        Config.LIBRARY_DIRS = self.library_dirs
+        self.db.close()
+        self.tmp.cleanup()
+    
+    def listed(self):
+        return [song['id'] for song in self.db.get_songs_page()]
+    
+    def test_flagged_songs_are_not_listed_or_queued(self):
+        self.paths[1].unlink()
+        
+        stats = self.file_manager.prune_missing(delete=False)
+        
+        kept = [self.song_ids[0], self.song_ids[2]]
+        self.assertEqual(stats['missing'], 1)
+        self.assertEqual(self.listed(), kept)
+        self.assertEqual(list(self.db.get_sorted_song_ids()), kept)
+        self.assertEqual(list(self.db.get_playlist_song_ids(self.playlist_id)), kept)
+        self.assertEqual([song['id'] for song in self.db.search_songs("Artist")], kept)
+        self.assertEqual(self.db.count_songs(), 2)
+    
+    def test_flags_clear_only_where_the_folder_was_listed(self):
+        self.paths[1].unlink()
+        self.file_manager.prune_missing(delete=False)
+        self.paths[1].write_bytes(b'')
+        # An offline library folder keeps its flags rather than clearing them
+        Config.LIBRARY_DIRS = [self.root, Path(self.tmp.name) / "offline"]
+        offline_path = Path(self.tmp.name) / "offline" / "gone.mp3"
+        offline_id = self.db.add_song("gone", "Artist", str(offline_path))
+        self.db.mark_missing_songs([offline_id])
+        
+        self.file_manager.prune_missing(delete=False)
+        
+        self.assertEqual(self.db.get_missing_song_ids(), {offline_id})
+        self.assertEqual(self.listed(), self.song_ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.playback_queue import PlaybackQueue, ShuffleOrder
+
+def drain(queue):
+    played = []
+    while True:
+        song_id = queue.next()
+        if song_id is None:
+            return played
+        played.append(song_id)
+
+class ShuffleOrderTests(unittest.TestCase):
+    def test_is_a_permutation_with_an_inverse(self):
+        for size in (1, 2, 3, 17, 1000):
+            order = ShuffleOrder(size, seed=7)
+            values = [order[position] for position in range(size)]
+            self.assertEqual(sorted(values), list(range(size)))
+            self.assertEqual([order.index(value) for value in values], list(range(size)))
+
+class ShuffleQueueTests(unittest.TestCase):
+    def test_remove_mid_run_does_not_repeat(self):
+        queue = PlaybackQueue(range(1, 21), current=1, shuffle=True)
+        played = [1] + [queue.next() for _ in range(5)]
+
+        queue.remove([20])
+        played += drain(queue)
+
+        self.assertEqual(len(played), len(set(played)))
+        self.assertEqual(set(played) | {20}, set(range(1, 21)))
+
+    def test_drain_across_append_and_remove_does_not_repeat(self):
+        queue = PlaybackQueue(range(1, 31), current=1, shuffle=True)
+        played = [1] + [queue.next() for _ in range(4)]
+
+        queue.append(range(31, 41))
+        played += [queue.next() for _ in range(6)]
+        # The song playing now and one still to come
+        upcoming = queue.peek_next()
+        queue.remove([played[-1], upcoming])
+        played += drain(queue)
+
+        self.assertEqual(len(played), len(set(played)))
+        self.assertNotIn(upcoming, played)
+        self.assertEqual(set(played) | {upcoming}, set(range(1, 41)))
+
+    def test_previous_retraces_across_a_redeal(self):
+        queue = PlaybackQueue(range(1, 11), current=1, shuffle=True)
+        played = [1] + [queue.next() for _ in range(3)]
+
+        queue.append([11, 12])
+
+        self.assertEqual([queue.previous() for _ in range(3)], played[-2::-1])
+        self.assertEqual(queue.next(), played[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import struct
+import sys
+import tempfile
+import time
+import unittest
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import _measure_playback, _timecode_flac, _timecode_wav
+from config import Config
+from database import Database
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+@unittest.skipUnless(pygame, "pygame is not installed")
+class DiskAudioTestCase(unittest.TestCase):
+    """Plays through SDL's disk driver, which writes what it renders to a file in real time"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rendered = Path(self.tmp.name) / "rendered.raw"
+        for name, value in (('SDL_AUDIODRIVER', 'disk'), ('SDL_DISKAUDIOFILE', str(self.rendered))):
+            self.addCleanup(self._restore_env, name, os.environ.get(name))
+            os.environ[name] = value
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+        except pygame.error as e:
+            self.skipTest(f"SDL disk audio driver unavailable: {e}")
+        pygame.mixer.quit()
+        
+        journal = Config.STATS_JOURNAL_PATH
+        self.addCleanup(setattr, Config, 'STATS_JOURNAL_PATH', journal)
+        Config.STATS_JOURNAL_PATH = Path(self.tmp.name) / "play_stats.journal"
+        self.db = Database(Path(self.tmp.name) / "test.db")
+        self.addCleanup(self.db.close)
+    
+    @staticmethod
+    def _restore_env(name, value):
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+class PositionAccuracyTests(DiskAudioTestCase):
+    """get_position against the frames being rendered"""
+    SECONDS = 5
+    
+    def _check(self, filename, write):
+        from modules.player import MusicPlayer
+        path = Path(self.tmp.name) / filename
+        frames = write(path, self.SECONDS)
+        song_id = self.db.add_song("Timecode", "Tests", str(path), duration=frames / 44100)
+        player = MusicPlayer(self.db)
+        try:
+            errors, latencies = _measure_playback(player, song_id, self.SECONDS, self.rendered)
+        finally:
+            pygame.mixer.quit()
+            player.stats.close()
+        
+        # Three seeks and a resume, each heard within two mixer buffers
+        self.assertEqual(len(latencies), 4)
+        self.assertLess(max(latencies), 2 * player._buffer_ms / 1000 + 0.05)
+        # Including the buffers right after each seek and resume is heard
+        self.assertTrue(any(since < 0.2 for since, error in errors[1:]))
+        worst = max(abs(error) for since, error in errors)
+        self.assertLess(worst, 0.05, f"position off by {worst * 1000:.1f} ms")
+    
+    def test_wav_position_within_50ms(self):
+        self._check("track.wav", _timecode_wav)
+    
+    def test_flac_position_within_50ms(self):
+        self._check("track.flac", _timecode_flac)
+
+def silent_mp3(path, frames, delay, padding):
+    """Write frames silent MPEG-1 Layer III frames after an Info frame with a LAME tag"""
+    def frame(payload=b''):
+        # 128 kbps, 44.1 kHz, stereo: 417 bytes with the header
+        return b'\xff\xfb\x90\x00' + payload.ljust(413, b'\0')
+    info = bytes(32) + b'Info' + struct.pack('>III', 0x0F, frames, 417 * (frames + 1))
+    info += bytes(100) + struct.pack('>I', 50)
+    lame = b'LAME3.100' + bytes(12) + (delay << 12 | padding).to_bytes(3, 'big') + bytes(12)
+    path.write_bytes(frame(info + lame) + frame() * frames)
+
+class GaplessTests(DiskAudioTestCase):
+    """Songs following each other through the decoded PCM stream"""
+    
+    def _add(self, filename, write, seconds):
+        path = Path(self.tmp.name) / filename
+        frames = write(path, seconds)
+        return self.db.add_song(filename, "Tests", str(path), duration=frames / 44100), frames
+    
+    def _play_through(self, player, next_song_id, seek):
+        """Play to the end, polling; returns (rendered frame numbers, song switched to, errors after it)"""
+        errors = []
+        switched = None
+        start = size = os.path.getsize(self.rendered)
+        with open(self.rendered, 'rb') as output:
+            player.play()
+            self.assertTrue(player.preload_next(next_song_id))
+            if seek is not None:
+                # Once the next song is decoded and appended
+                time.sleep(0.5)
+                player.set_position(seek)
+            while True:
+                if player.poll():
+                    switched = player.current_song_id
+                if not player.is_playing:
+                    break
+                grown = os.path.getsize(self.rendered)
+                if grown == size:
+                    time.sleep(0.001)
+                    continue
+                # A buffer was just written: it starts playing now
+                position = player.get_position()
+                output.seek(size)
+                size = grown
+                high, low = struct.unpack('<hh', output.read(4))
+                if switched and high << 15 | low:
+                    errors.append(position - ((high << 15 | low) - 1) / 44100)
+            # Let the driver write out the last buffers
+            time.sleep(0.3)
+            output.seek(start)
+            samples = array('h', output.read())
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        numbers = [samples[i] << 15 | samples[i + 1] for i in range(0, len(samples) - 1, 2)]
+        return numbers, switched, errors
+    
+    def _check_switch(self, seek=None):
+        from modules.player import MusicPlayer
+        # Of different lengths, so their last frame numbers differ
+        first, first_frames = self._add("first.wav", _timecode_wav, 1.5)
+        second, second_frames = self._add("second.flac", _timecode_flac, 1.0)
+        player = MusicPlayer(self.db)
+        try:
+            player.set_volume(100)
+            self.assertTrue(player.load_song(first))
+            numbers, switched, errors = self._play_through(player, second, seek)
+        finally:
+            pygame.mixer.quit()
+            player.stats.close()
+        
+        self.assertEqual(switched, second)
+        # The second song's first sample comes right after the first song's last
+        end = len(numbers) - 1 - numbers[::-1].index(first_frames)
+        self._assert_frames(numbers[end - 22049:end + 1], range(first_frames - 22049, first_frames + 1))
+        self._assert_frames(numbers[end + 1:end + 1 + second_frames], range(1, second_frames + 1))
+        self.assertTrue(errors)
+        self.assertLess(max(abs(error) for error in errors), 0.05)
+    
+    def _assert_frames(self, numbers, expected):
+        """Compare rendered frame numbers, reporting the first one out of place"""
+        for index, (number, wanted) in enumerate(zip(numbers, expected)):
+            if number != wanted:
+                self.fail(f"frame {index} is {number}, expected {wanted}")
+        self.assertEqual(len(numbers), len(expected))
+
+    def test_next_song_follows_without_a_gap(self):
+        self._check_switch()
+    
+    def test_next_song_follows_after_a_seek(self):
+        self._check_switch(seek=0.9)
+    
+    def test_lame_delay_and_padding_are_cut(self):
+        from modules.player import MusicPlayer, MP3_DECODER_DELAY
+        path = Path(self.tmp.name) / "silence.mp3"
+        silent_mp3(path, 100, 576, 1000)
+        audible = 100 * 1152 - 576 - 1000
+        player = MusicPlayer(self.db)
+        try:
+            self.assertEqual(len(player._decode(path)) // 4, audible)
+            # From a decoder that leaves them in, where frame i holds i
+            untrimmed = array('h', (i & 0x7FFF for i in range(100 * 1152) for channel in (0, 1)))
+            trimmed = array('h', player._trim_encoder_delay(path, untrimmed.tobytes()))
+        finally:
+            pygame.mixer.quit()
+            player.stats.close()
+        self.assertEqual(len(trimmed) // 2, audible)
+        self.assertEqual(trimmed[0], 576 + MP3_DECODER_DELAY)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from collections import defaultdict
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase(QObject):
+    """Runs Database queries on a worker thread and reports back on the GUI thread
+    
+    Every query belongs to a channel (e.g. "songs", "playlists"). Submitting
+    a query supersedes whatever is queued or in flight on the same channel:
+    a stale query that has not started yet is skipped, and the result of
+    one that already ran is dropped instead of being delivered.
+    """
+    resultReady = pyqtSignal(str, object)  # channel, result
+    queryFailed = pyqtSignal(str, str)  # channel, error message
+    _completed = pyqtSignal(object, object, object)  # request, result, error
+    
+    def __init__(self, database, parent=None):
+        super().__init__(parent)
+        self.db = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncDatabase")
+        self._lock = threading.Lock()
+        self._generations = defaultdict(int)
+        self._request_ids = itertools.count(1)
+        self._callbacks = {}
+        self._completed.connect(self._on_completed)
+    
+    def submit(self, channel, query, *args, callback=None, **kwargs):
+        """Queue a query and return its Future
+        
+        query is a Database method name or any callable. callback, if
+        given, is called on the GUI thread with the result, unless a newer
+        query on the same channel has been submitted in the meantime.
+        """
+        func = getattr(self.db, query) if isinstance(query, str) else query
+        
+        with self._lock:
+            self._generations[channel] += 1
+            request = (channel, self._generations[channel], next(self._request_ids))
+            if callback:
+                self._callbacks[request] = callback
+        
+        return self._executor.submit(self._run, request, func, args, kwargs)
+    
+    def cancel(self, channel):
+        """Discard anything queued or in flight on channel"""
+        with self._lock:
+            self._generations[channel] += 1
+    
+    def is_current(self, request):
+        channel, generation, _ = request
+        with self._lock:
+            return self._generations[channel] == generation
+    
+    def _run(self, request, func, args, kwargs):
+        """Worker thread: run the query unless it was superseded while queued"""
+        if not self.is_current(request):
+            self._completed.emit(request, None, CancelledError())
+            raise CancelledError()
+        
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._completed.emit(request, None, e)
+            raise
+        
+        self._completed.emit(request, result, None)
+        return result
+    
+    def _on_completed(self, request, result, error):
+        """GUI thread: deliver a result if it is still the newest on its channel"""
+        callback = self._callbacks.pop(request, None)
+        channel = request[0]
+        
+        if not self.is_current(request) or isinstance(error, CancelledError):
+            return
+        
+        if error is not None:
+            logger.error(f"Query on {channel} failed: {error}")
+            self.queryFailed.emit(channel, str(error))
+            return
+        
+        if callback:
+            callback(result)
+        self.resultReady.emit(channel, result)
+    
+    def shutdown(self):
+        """Stop accepting queries and wait for the one in flight"""
+        with self._lock:
+            for channel in self._generations:
+                self._generations[channel] += 1
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._callbacks.clear()
@@ -0,0 +1,166 @@
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LibraryWatcher(QObject):
+    """Keeps the database in step with the library folders while the app runs
+    
+    Every library directory is watched (inotify on Linux); song files
+    are not, since a watch per file would run into the inotify limit on
+    a large library and leave later folders unwatched. Directory events
+    cover songs being added, removed, renamed or replaced; tags edited in
+    place are caught by the next full scan's fingerprints. Events only
+    mark their directory dirty; once no event has arrived for
+    Config.WATCH_DEBOUNCE_MS, the dirty directories are synced in one pass
+    on a worker thread, so a burst of copies, moves or deletes costs one
+    listing per directory and a file moved between two folders is seen as
+    a move. A full incremental scan runs once at start to catch whatever
+    changed while the app was closed, and again whenever scan() is called;
+    full scans report progress and can be cancelled.
+    """
+    libraryChanged = pyqtSignal(object)  # {'added', 'updated', 'moved', 'removed': [song ids]}
+    scanProgress = pyqtSignal(object)  # iter_scan progress snapshot
+    scanFinished = pyqtSignal(object)  # scan_library stats of a full scan
+    _synced = pyqtSignal(object, object, object)  # stats, directories to watch, error
+    
+    def __init__(self, file_manager, roots=None, parent=None):
+        super().__init__(parent)
+        self.file_manager = file_manager
+        self.roots = [str(root) for root in (roots or Config.LIBRARY_DIRS)]
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LibraryWatcher")
+        self._dirty = set()
+        self._busy = False
+        self._stopped = False
+        self._watching = False
+        self._scan_requested = False
+        self._cancel = threading.Event()
+        
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(Config.WATCH_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._sync_dirty)
+        
+        self._synced.connect(self._on_synced)
+    
+    def start(self):
+        """Scan the roots in the background, then start watching them"""
+        self._watching = True
+        self.scan()
+    
+    def scan(self):
+        """Run a full incremental scan of the roots in the background"""
+        if self._busy:
+            self._scan_requested = True
+            return
+        
+        self._scan_requested = False
+        self._cancel = threading.Event()
+        self._busy = True
+        self._executor.submit(self._run, self._full_scan, self._cancel)
+    
+    def cancel_scan(self):
+        """Abort a full scan that is queued or running"""
+        self._scan_requested = False
+        self._cancel.set()
+    
+    def stop(self):
+        """Stop watching and wait for a sync in flight"""
+        self._stopped = True
+        self._cancel.set()
+        self._debounce.stop()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _on_directory_changed(self, path):
+        self._mark_dirty(path)
+    
+    def _mark_dirty(self, directory):
+        """Queue a directory for syncing and restart the quiet period"""
+        self._dirty.add(directory)
+        if not self._busy:
+            self._debounce.start()
+    
+    def _sync_dirty(self):
+        """GUI thread: hand the dirty directories to the worker"""
+        if self._busy or not self._dirty or self._stopped:
+            return
+        
+        directories, self._dirty = self._dirty, set()
+        watched = set(self._watcher.directories())
+        self._busy = True
+        self._executor.submit(self._run, self._sync, directories, watched)
+    
+    def _run(self, func, *args):
+        """Worker thread: run a sync and report back to the GUI thread"""
+        try:
+            stats, paths = func(*args)
+        except Exception as e:
+            self._synced.emit(None, [], e)
+            return
+        self._synced.emit(stats, paths, None)
+    
+    def _full_scan(self, cancel):
+        """Worker thread: scan every root and list the paths to watch"""
+        totals = {'seen': 0, 'unchanged': 0, 'added': 0, 'updated': 0, 'moved': 0, 'removed': 0}
+        paths = []
+        for root in self.roots:
+            if not os.path.isdir(root):
+                logger.warning(f"Library folder {root} does not exist")
+                continue
+            
+            stats = self.file_manager.scan_library(
+                root=root, cancel=cancel, progress=self.scanProgress.emit
+            )
+            for key in totals:
+                totals[key] += stats[key]
+            if stats['cancelled']:
+                break
+            
+            if self._watching:
+                paths.extend(directory for directory, _, _ in os.walk(root))
+        
+        totals['cancelled'] = cancel.is_set()
+        return totals, paths
+    
+    def _sync(self, directories, watched):
+        """Worker thread: sync the dirty directories and list new paths to watch"""
+        stats = self.file_manager.sync_directories(directories, watched, roots=self.roots)
+        paths = [directory for directory in list(directories) + stats['new_dirs']
+                 if os.path.isdir(directory)]
+        return stats, paths
+    
+    def _on_synced(self, stats, paths, error):
+        """GUI thread: watch new paths, report changes and pick up queued events"""
+        self._busy = False
+        if self._stopped:
+            return
+        
+        if error is not None:
+            logger.error(f"Library sync failed: {error}")
+        else:
+            watched = set(self._watcher.directories())
+            new_paths = [path for path in dict.fromkeys(paths) if path not in watched]
+            if new_paths:
+                self._watcher.addPaths(new_paths)
+            
+            if 'changes' not in stats:
+                # Only full scans report plain counts
+                self.scanFinished.emit(stats)
+            elif any(stats['changes'].values()):
+                logger.info(
+                    f"Library changed: {stats['added']} added, {stats['updated']} changed, "
+                    f"{stats['moved']} moved, {stats['removed']} removed"
+                )
+                self.libraryChanged.emit(stats['changes'])
+        
+        if self._scan_requested:
+            self.scan()
+        elif self._dirty:
+            self._debounce.start()
@@ -8,6 +8,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QThread
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon
+from concurrent.futures import ThreadPoolExecutor
 import os
 from pathlib import Path
 
@@ -16,10 +17,15 @@ from database import Database
 from modules.downloader import YouTubeDownloader
 from modules.file_manager import FileManager
 from modules.player import MusicPlayer
+from modules.playback_queue import PlaybackQueue
 from ui.player_controls import PlayerControls
 from ui.playlist_widget import PlaylistWidget
+from ui.async_database import AsyncDatabase
+from ui.library_watcher import LibraryWatcher
 
 class MainWindow(QMainWindow):
+    _tagsEdited = pyqtSignal(object, object)  # edit_songs results, error
+    
     def __init__(self):
         super().__init__()
         
@@ -28,13 +34,30 @@ class MainWindow(QMainWindow):
         self.downloader = YouTubeDownloader()
         self.file_manager = FileManager(self.db)
         self.player = MusicPlayer(self.db)
+        self.queue = PlaybackQueue()
         
         self.current_song_id = None
         self.is_playing = False
+        self.library_sort = 'title'
+        self._library_after = None
+        self._library_exhausted = False
+        self._library_loading = False
+        self.async_db = AsyncDatabase(self.db, self)
+        self.library_watcher = LibraryWatcher(self.file_manager, parent=self)
+        # Bulk tag edits run one after another, off the GUI and query threads
+        self._tag_editor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TagEditor")
+        self._tagsEdited.connect(self._on_tags_edited)
         
         self.init_ui()
         self.setup_connections()
-        self.scan_library()
+        
+        # Show what is already in the database; the scan catches up in the background
+        self.load_songs()
+        self.status_bar.showMessage("Checking library for changes...")
+        if Config.WATCH_LIBRARY:
+            self.library_watcher.start()
+        else:
+            self.scan_library()
         
         # Timer for updating player progress
         self.update_timer = QTimer()
@@ -87,6 +110,7 @@ class MainWindow(QMainWindow):
         self.songs_table.doubleClicked.connect(self.on_song_double_clicked)
         self.songs_table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.songs_table.customContextMenuRequested.connect(self.show_song_context_menu)
+        self.songs_table.verticalScrollBar().valueChanged.connect(self.on_songs_scrolled)
         left_layout.addWidget(self.songs_table)
         
         # Download section
@@ -112,7 +136,7 @@ class MainWindow(QMainWindow):
         splitter.addWidget(left_widget)
         
         # Right side - Playlists
-        self.playlist_widget = PlaylistWidget(self.db)
+        self.playlist_widget = PlaylistWidget(self.db, async_db=self.async_db)
         splitter.addWidget(self.playlist_widget)
         
         # Set splitter sizes
@@ -126,6 +150,10 @@ class MainWindow(QMainWindow):
         # Status bar
         self.status_bar = self.statusBar()
         self.status_bar.showMessage("Ready")
+        
+        self.cancel_scan_btn = QPushButton("Cancel Scan")
+        self.cancel_scan_btn.setVisible(False)
+        self.status_bar.addPermanentWidget(self.cancel_scan_btn)
     
     def create_menu_bar(self):
         menu_bar = self.menuBar()
@@ -193,11 +221,20 @@ class MainWindow(QMainWindow):
         self.player_controls.positionChanged.connect(self.on_position_changed)  # Changed!
         self.player_controls.nextClicked.connect(self.next_song)
         self.player_controls.prevClicked.connect(self.previous_song)
+        self.player_controls.shuffleToggled.connect(self.set_shuffle)
+        self.player_controls.repeatChanged.connect(self.set_repeat)
         
         # Playlist widget
-        self.playlist_widget.songSelected.connect(self.play_song_by_id)
+        self.playlist_widget.songSelected.connect(self.play_from_playlist)
+        self.playlist_widget.removeFromPlaylist.connect(self.on_playlist_song_removed)
         self.playlist_widget.playlistRenamed.connect(self.on_playlist_renamed)
         self.playlist_widget.playlistDeleted.connect(self.on_playlist_deleted)
+        
+        # Library watcher
+        self.library_watcher.scanProgress.connect(self.on_scan_progress)
+        self.library_watcher.scanFinished.connect(self.on_library_scanned)
+        self.cancel_scan_btn.clicked.connect(self.library_watcher.cancel_scan)
+        self.library_watcher.libraryChanged.connect(self.on_library_changed)
 
     def on_position_changed(self, value):
         """Handle position changes from slider or skip buttons"""
@@ -214,88 +251,207 @@ class MainWindow(QMainWindow):
                 self.player.set_position(position)
 
     def next_song(self):
-        """Play next song in current playlist or library"""
-        if self.playlist_widget.current_playlist_id:
-            # Get current playlist songs
-            songs = self.db.get_playlist_songs(self.playlist_widget.current_playlist_id)
-            if songs:
-                current_index = next((i for i, s in enumerate(songs) 
-                                    if s['id'] == self.current_song_id), -1)
-                if current_index >= 0 and current_index < len(songs) - 1:
-                    next_song_id = songs[current_index + 1]['id']
-                    self.play_song_by_id(next_song_id)
-        else:
-            # Play next song in library
-            songs = self.db.get_all_songs()
-            if songs:
-                current_index = next((i for i, s in enumerate(songs) 
-                                    if s['id'] == self.current_song_id), -1)
-                if current_index >= 0 and current_index < len(songs) - 1:
-                    next_song_id = songs[current_index + 1]['id']
-                    self.play_song_by_id(next_song_id)
+        """Play the next song in the queue"""
+        song_id = self.queue.next()
+        if song_id:
+            self.play_song_by_id(song_id)
 
     def previous_song(self):
-        """Play previous song in current playlist or library"""
-        if self.playlist_widget.current_playlist_id:
-            # Get current playlist songs
-            songs = self.db.get_playlist_songs(self.playlist_widget.current_playlist_id)
-            if songs:
-                current_index = next((i for i, s in enumerate(songs) 
-                                    if s['id'] == self.current_song_id), -1)
-                if current_index > 0:
-                    prev_song_id = songs[current_index - 1]['id']
-                    self.play_song_by_id(prev_song_id)
+        """Play the song played before this one"""
+        song_id = self.queue.previous()
+        if song_id:
+            self.play_song_by_id(song_id)
+
+    def _play_in_context(self, song_id, source, load_ids):
+        """Play song_id, queueing the context it was picked from
+        
+        The context's ids are only fetched when it differs from the one
+        already queued, so picking another song from the same view or
+        playlist just moves the cursor.
+        """
+        if self.queue.source == source and song_id in self.queue.ids:
+            self.queue.jump(song_id)
+        else:
+            self.queue = PlaybackQueue(
+                load_ids(), source, current=song_id,
+                shuffle=self.queue.shuffle is not None, repeat=self.queue.repeat
+            )
+        self.play_song_by_id(song_id)
+
+    def play_from_view(self, song_id):
+        """Play a song from the table, followed by the rest of the view"""
+        query = self.search_input.text()
+        if query:
+            # Search results are all in the table
+            self._play_in_context(song_id, ('search', query), lambda: [
+                self.songs_table.item(row, 0).data(Qt.UserRole)
+                for row in range(self.songs_table.rowCount())
+            ])
         else:
-            # Play previous song in library
-            songs = self.db.get_all_songs()
-            if songs:
-                current_index = next((i for i, s in enumerate(songs) 
-                                    if s['id'] == self.current_song_id), -1)
-                if current_index > 0:
-                    prev_song_id = songs[current_index - 1]['id']
-                    self.play_song_by_id(prev_song_id)
+            sort = self.library_sort
+            self._play_in_context(song_id, ('library', sort),
+                                  lambda: self.db.get_sorted_song_ids(sort))
+
+    def play_from_playlist(self, song_id):
+        """Play a song from the open playlist, followed by the rest of it"""
+        playlist_id = self.playlist_widget.current_playlist_id
+        if playlist_id is None:
+            self.play_song_by_id(song_id)
+            return
+        self._play_in_context(song_id, ('playlist', playlist_id),
+                              lambda: self.db.get_playlist_song_ids(playlist_id))
+
+    def set_shuffle(self, enabled):
+        """Shuffle the queue from the current song on, or go back to its order"""
+        self.queue.set_shuffle(enabled)
+        self.on_queue_changed()
+
+    def set_repeat(self, mode):
+        """Set the queue's repeat mode: 'off', 'all' or 'one'"""
+        self.queue.repeat = mode
+        self.on_queue_changed()
+
+    def on_queue_changed(self):
+        """Decode the new next song after the queue was edited"""
+        if self.current_song_id and self.player.get_state() != "stopped":
+            self.preload_next_song()
+
+    def on_playlist_song_removed(self, playlist_id, song_id):
+        """Drop a song removed from the playlist being played from the queue"""
+        if self.queue.source == ('playlist', playlist_id):
+            self.queue.remove([song_id])
+            self.on_queue_changed()
 
     def scan_library(self):
-        """Scan downloads folder for music"""
+        """Scan downloads folder for music in the background"""
         self.status_bar.showMessage("Scanning library...")
+        self.cancel_scan_btn.setVisible(True)
+        self.library_watcher.scan()
+    
+    def on_scan_progress(self, progress):
+        """Show live scan progress in the status bar"""
+        self.cancel_scan_btn.setVisible(True)
+        self.status_bar.showMessage(
+            f"Scanning library: {progress['seen']} files, {progress['parsed']} read, "
+            f"{progress['skipped']} unchanged ({progress['rate']:.0f} files/s)"
+        )
+    
+    def on_library_scanned(self, stats):
+        """Reload the table if a full scan found changes"""
+        self.cancel_scan_btn.setVisible(False)
+        if stats['added'] or stats['updated'] or stats['moved'] or stats['removed']:
+            self.refresh_song_view()
+        
+        if stats['cancelled']:
+            self.status_bar.showMessage(f"Library scan cancelled after {stats['seen']} files")
+        else:
+            self.status_bar.showMessage(
+                f"Library scanned: {stats['seen']} songs found, "
+                f"{stats['added'] + stats['updated']} new or changed"
+            )
+    
+    def on_library_changed(self, changes):
+        """Apply row-level changes reported by the library watcher"""
+        removed = set(changes['removed'])
+        if removed:
+            self.queue.remove(removed)
+            self.on_queue_changed()
+        if changes['added'] and self.queue.source and self.queue.source[0] == 'library':
+            # Rebuild the library queue in the new order when a song is next picked
+            self.queue.source = None
+        
+        if self.search_input.text() or changes['added']:
+            # New rows need their sorted place, so fetch the view again
+            self.refresh_song_view()
+            return
         
-        try:
-            music_files = self.file_manager.scan_library()
+        changed = set(changes['updated']) | set(changes['moved'])
+        for row in range(self.songs_table.rowCount() - 1, -1, -1):
+            item = self.songs_table.item(row, 0)
+            song_id = item.data(Qt.UserRole) if item else None
+            if song_id in removed:
+                self.songs_table.removeRow(row)
+            elif song_id in changed:
+                song = self.db.get_song(song_id)
+                if song:
+                    self._set_song_row(row, song)
+    
+    def refresh_song_view(self):
+        """Reload the library page or re-run the current search"""
+        if self.search_input.text():
+            self.search_songs()
+        else:
             self.load_songs()
-            self.status_bar.showMessage(f"Library scanned: {len(music_files)} songs found")
-        except Exception as e:
-            self.status_bar.showMessage(f"Error scanning library: {str(e)}")
-            QMessageBox.critical(self, "Error", f"Failed to scan library: {str(e)}")
     
     def load_songs(self):
-        """Load songs into table"""
-        songs = self.db.get_all_songs()
-        self.songs_table.setRowCount(len(songs))
+        """Load the first page of songs into table"""
+        self.songs_table.setRowCount(0)
+        self._library_after = None
+        self._library_exhausted = False
+        self._library_loading = False
+        self.load_more_songs()
+    
+    def load_more_songs(self):
+        """Request the next page of library songs"""
+        if self._library_exhausted or self._library_loading:
+            return
         
-        for row, song in enumerate(songs):
-            # Title
-            title_item = QTableWidgetItem(song['title'])
-            title_item.setData(Qt.UserRole, song['id'])
-            self.songs_table.setItem(row, 0, title_item)
-            
-            # Artist
-            artist_item = QTableWidgetItem(song['artist'])
-            self.songs_table.setItem(row, 1, artist_item)
-            
-            # Album
-            album_item = QTableWidgetItem(song['album'] or '')
-            self.songs_table.setItem(row, 2, album_item)
-            
-            # Duration
-            duration = self.format_duration(song['duration'])
-            duration_item = QTableWidgetItem(duration)
-            self.songs_table.setItem(row, 3, duration_item)
-            
-            # Play count
-            plays_item = QTableWidgetItem(str(song['play_count']))
-            self.songs_table.setItem(row, 4, plays_item)
+        self._library_loading = True
+        self.async_db.submit(
+            'songs', 'get_songs_page', self.library_sort, self._library_after,
+            callback=self._append_songs_page
+        )
+    
+    def _append_songs_page(self, songs):
+        """Append a fetched page of library songs to the table"""
+        self._library_loading = False
+        if len(songs) < Config.DB_PAGE_SIZE:
+            self._library_exhausted = True
+        if not songs:
+            return
+        
+        self._library_after = self.db.song_sort_key(songs[-1], self.library_sort)
         
-        self.songs_table.resizeColumnsToContents()
+        first_row = self.songs_table.rowCount()
+        self.songs_table.setRowCount(first_row + len(songs))
+        for row, song in enumerate(songs, first_row):
+            self._set_song_row(row, song)
+        
+        if first_row == 0:
+            self.songs_table.resizeColumnsToContents()
+    
+    def on_songs_scrolled(self, value):
+        """Fetch the next page when the table is scrolled near the bottom"""
+        if self.search_input.text():
+            return
+        
+        scroll_bar = self.songs_table.verticalScrollBar()
+        if value >= scroll_bar.maximum() - 10:
+            self.load_more_songs()
+    
+    def _set_song_row(self, row, song):
+        """Fill one table row from a song record"""
+        # Title
+        title_item = QTableWidgetItem(song['title'])
+        title_item.setData(Qt.UserRole, song['id'])
+        self.songs_table.setItem(row, 0, title_item)
+        
+        # Artist
+        artist_item = QTableWidgetItem(song['artist'])
+        self.songs_table.setItem(row, 1, artist_item)
+        
+        # Album
+        album_item = QTableWidgetItem(song['album'] or '')
+        self.songs_table.setItem(row, 2, album_item)
+        
+        # Duration
+        duration = self.format_duration(song['duration'])
+        duration_item = QTableWidgetItem(duration)
+        self.songs_table.setItem(row, 3, duration_item)
+        
+        # Play count
+        plays_item = QTableWidgetItem(str(song['play_count']))
+        self.songs_table.setItem(row, 4, plays_item)
     
     def search_songs(self):
         """Search songs based on search input"""
@@ -304,31 +460,15 @@ class MainWindow(QMainWindow):
             self.load_songs()
             return
         
-        songs = self.db.search_songs(query)
+        # Supersedes any page load or older search still in flight
+        self.async_db.submit('songs', 'search_songs', query, callback=self._show_search_results)
+    
+    def _show_search_results(self, songs):
+        """Replace the table contents with search results"""
         self.songs_table.setRowCount(len(songs))
         
         for row, song in enumerate(songs):
-            # Title
-            title_item = QTableWidgetItem(song['title'])
-            title_item.setData(Qt.UserRole, song['id'])
-            self.songs_table.setItem(row, 0, title_item)
-            
-            # Artist
-            artist_item = QTableWidgetItem(song['artist'])
-            self.songs_table.setItem(row, 1, artist_item)
-            
-            # Album
-            album_item = QTableWidgetItem(song['album'] or '')
-            self.songs_table.setItem(row, 2, album_item)
-            
-            # Duration
-            duration = self.format_duration(song['duration'])
-            duration_item = QTableWidgetItem(duration)
-            self.songs_table.setItem(row, 3, duration_item)
-            
-            # Play count
-            plays_item = QTableWidgetItem(str(song['play_count']))
-            self.songs_table.setItem(row, 4, plays_item)
+            self._set_song_row(row, song)
     
     def download_song(self):
         """Download song from YouTube"""
@@ -410,6 +550,27 @@ class MainWindow(QMainWindow):
             song = self.db.get_song(song_id)
             if song:
                 self.status_bar.showMessage(f"Now playing: {song['title']} - {song['artist']}")
+            
+            self.preload_next_song()
+    
+    def preload_next_song(self):
+        """Decode the following song so it starts right after the current one's last sample"""
+        song_id = self.queue.peek_next(auto=True)
+        if song_id:
+            self.player.preload_next(song_id)
+    
+    def on_track_advanced(self):
+        """The preloaded song has started: follow it and queue the one after"""
+        if self.queue.peek_next(auto=True) == self.player.current_song_id:
+            self.queue.next(auto=True)
+        else:
+            # Already playing out of the stream when an edit replaced it
+            self.queue.jump(self.player.current_song_id)
+        self.current_song_id = self.player.current_song_id
+        song = self.db.get_song(self.current_song_id)
+        if song:
+            self.status_bar.showMessage(f"Now playing: {song['title']} - {song['artist']}")
+        self.preload_next_song()
     
     def play_current_song(self):
         """Play currently selected song"""
@@ -419,6 +580,7 @@ class MainWindow(QMainWindow):
         if self.player.play():
             self.is_playing = True
             self.player_controls.set_playing_state(True)
+            self.preload_next_song()
     
     def pause_playback(self):
         """Pause playback"""
@@ -442,6 +604,9 @@ class MainWindow(QMainWindow):
     def update_player_display(self):
         """Update player controls display"""
         try:
+            if self.player.poll():
+                self.on_track_advanced()
+            
             if self.player.is_playing:
                 current_time = self.player.get_position()
                 total_time = self.player.length
@@ -459,7 +624,7 @@ class MainWindow(QMainWindow):
         """Handle song double click in table"""
         row = index.row()
         song_id = self.songs_table.item(row, 0).data(Qt.UserRole)
-        self.play_song_by_id(song_id)
+        self.play_from_view(song_id)
     
     def show_song_context_menu(self, position):
         """Show context menu for songs in table"""
@@ -467,13 +632,14 @@ class MainWindow(QMainWindow):
         if not indexes:
             return
         
-        # Get unique song IDs from selected rows
-        song_ids = set()
-        for index in indexes:
+        # Get unique song IDs from selected rows, in table order
+        song_ids = []
+        for index in sorted(indexes, key=lambda index: index.row()):
             if index.column() == 0:  # Only get from title column
                 song_id = self.songs_table.item(index.row(), 0).data(Qt.UserRole)
                 if song_id:
-                    song_ids.add(song_id)
+                    song_ids.append(song_id)
+        song_ids = list(dict.fromkeys(song_ids))
         
         if not song_ids:
             return
@@ -481,6 +647,8 @@ class MainWindow(QMainWindow):
         menu = QMenu()
         
         play_action = menu.addAction("Play")
+        play_next_action = menu.addAction("Play Next")
+        enqueue_action = menu.addAction("Add to Queue")
         menu.addSeparator()
         
         # Get playlists for adding songs
@@ -492,21 +660,36 @@ class MainWindow(QMainWindow):
                 playlist_action.setData(playlist['id'])
         
         rename_action = menu.addAction("Rename")
+        edit_tags_action = menu.addAction("Edit Tags...")
         delete_action = menu.addAction("Delete")
         
         action = menu.exec_(self.songs_table.mapToGlobal(position))
         
         if action == play_action:
             # Play first selected song
-            self.play_song_by_id(next(iter(song_ids)))
+            self.play_from_view(next(iter(song_ids)))
+        elif action == play_next_action:
+            self.queue.insert_next(song_ids)
+            self.on_queue_changed()
+        elif action == enqueue_action:
+            self.queue.append(song_ids)
+            self.on_queue_changed()
         elif action == rename_action:
             self.rename_selected_song()
+        elif action == edit_tags_action:
+            self.edit_selected_tags(song_ids)
         elif action == delete_action:
             self.delete_selected_song()
         elif action and action.parent() == add_to_menu:
             playlist_id = action.data()
-            for song_id in song_ids:
-                self.db.add_song_to_playlist(playlist_id, song_id)
+            added = self.db.add_songs_to_playlist(playlist_id, song_ids)
+            if added and self.queue.source == ('playlist', playlist_id):
+                # The playlist skipped songs it already had; so does its queue
+                self.queue.append([song_id for song_id in song_ids
+                                   if song_id not in self.queue.ids])
+                self.on_queue_changed()
+            self.status_bar.showMessage(f"Added {added} songs to {action.text()}")
+            self.playlist_widget.load_playlists()
             
             # Refresh playlist if it's currently selected
             if self.playlist_widget.current_playlist_id == playlist_id:
@@ -539,6 +722,48 @@ class MainWindow(QMainWindow):
             else:
                 QMessageBox.critical(self, "Error", "Failed to rename song")
     
+    def edit_selected_tags(self, song_ids):
+        """Set one tag field on every selected song"""
+        field, ok = QInputDialog.getItem(
+            self, "Edit Tags", f"Field to change on {len(song_ids)} songs:",
+            ["Artist", "Album", "Title"], 0, False
+        )
+        if not ok:
+            return
+        
+        value, ok = QInputDialog.getText(self, "Edit Tags", f"New {field.lower()}:")
+        if not ok:
+            return
+        
+        edits = {song_id: {field.lower(): value} for song_id in song_ids}
+        self.status_bar.showMessage(f"Updating tags of {len(song_ids)} songs...")
+        self._tag_editor.submit(self._edit_tags, edits)
+    
+    def _edit_tags(self, edits):
+        """Worker thread: apply a bulk tag edit and hand its results back"""
+        try:
+            self._tagsEdited.emit(self.file_manager.edit_songs(edits), None)
+        except Exception as e:
+            self._tagsEdited.emit(None, e)
+    
+    def _on_tags_edited(self, results, error):
+        """Report a finished bulk tag edit and refresh the edited rows"""
+        if error is not None:
+            self.status_bar.showMessage("Tag update failed")
+            QMessageBox.critical(self, "Edit Tags", f"Tag update failed: {error}")
+            return
+        
+        failed = [result for result in results if result['status'] == 'failed']
+        self.on_library_changed({
+            'added': [], 'moved': [], 'removed': [],
+            'updated': [result['song_id'] for result in results if result['status'] != 'failed']
+        })
+        
+        self.status_bar.showMessage(f"Updated {len(results) - len(failed)} songs, {len(failed)} failed")
+        if failed:
+            details = '\n'.join(f"{result['filepath']}: {result['error']}" for result in failed[:10])
+            QMessageBox.warning(self, "Edit Tags", f"Some files could not be updated:\n{details}")
+    
     def delete_selected_song(self):
         """Delete selected song"""
         indexes = self.songs_table.selectedIndexes()
@@ -575,6 +800,8 @@ class MainWindow(QMainWindow):
             # Delete songs
             for song_id in song_ids:
                 self.file_manager.delete_song(song_id, delete_from_disk)
+            self.queue.remove(song_ids)
+            self.on_queue_changed()
             
             # Reload songs
             self.load_songs()
@@ -613,24 +840,35 @@ class MainWindow(QMainWindow):
     
     def organize_library(self):
         """Organize library into folders"""
+        plan = self.file_manager.organize_library("Artist/Album", dry_run=True)
+        if not plan['moves']:
+            self.status_bar.showMessage("Library is already organized")
+            return
+        
+        message = f"Move {len(plan['moves'])} songs into Artist/Album folders?"
+        if plan['renamed']:
+            message += f"\n{len(plan['renamed'])} will be renamed to avoid overwriting other files."
         reply = QMessageBox.question(
-            self, "Organize Library",
-            "Organize music library into Artist/Album folders?",
+            self, "Organize Library", message,
             QMessageBox.Yes | QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            self.file_manager.organize_library("Artist/Album")
-            self.scan_library()
-            self.status_bar.showMessage("Library organized")
+            stats = self.file_manager.organize_library("Artist/Album")
+            self.refresh_song_view()
+            self.status_bar.showMessage(
+                f"Library organized: {stats['moved'] + stats['copied']} songs moved, "
+                f"{stats['failed']} failed"
+            )
     
     def on_playlist_renamed(self, playlist_id, new_name):
         """Handle playlist renamed"""
         pass  # Already handled in playlist widget
     
     def on_playlist_deleted(self, playlist_id):
-        """Handle playlist deleted"""
-        pass  # Already handled in playlist widget
+        """Keep playing a deleted playlist's queue, detached from the playlist"""
+        if self.queue.source == ('playlist', playlist_id):
+            self.queue.source = None
     
     def show_about(self):
         """Show about dialog"""
@@ -669,4 +907,10 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """Handle application close"""
         self.player.stop()
+        self.library_watcher.stop()
+        # Let queued tag edits finish rather than drop them half-applied
+        self._tag_editor.shutdown(wait=True)
+        self.async_db.shutdown()
+        self.player.stats.close()
+        self.db.close()
         event.accept()
\ No newline at end of file
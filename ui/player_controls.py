@@ -13,6 +13,8 @@ class PlayerControls(QWidget):
     nextClicked = pyqtSignal()
     prevClicked = pyqtSignal()
     volumeChanged = pyqtSignal(int)
+    shuffleToggled = pyqtSignal(bool)
+    repeatChanged = pyqtSignal(str)  # 'off', 'all' or 'one'
     positionChanged = pyqtSignal(float)  # 0.0 to 1.0
     
     def __init__(self, parent=None):
@@ -88,6 +90,21 @@ class PlayerControls(QWidget):
         self.skip_forward_btn.setFixedSize(80, 40)
         self.skip_forward_btn.clicked.connect(self._skip_forward)
         
+        # Shuffle button
+        self.shuffle_btn = QPushButton("🔀")
+        self.shuffle_btn.setFixedSize(40, 40)
+        self.shuffle_btn.setCheckable(True)
+        self.shuffle_btn.setToolTip("Shuffle")
+        self.shuffle_btn.toggled.connect(self.shuffleToggled.emit)
+        
+        # Repeat button: cycles off, all, one
+        self.repeat_mode = 'off'
+        self.repeat_btn = QPushButton("🔁")
+        self.repeat_btn.setFixedSize(40, 40)
+        self.repeat_btn.setCheckable(True)
+        self.repeat_btn.setToolTip("Repeat: off")
+        self.repeat_btn.clicked.connect(self._cycle_repeat)
+        
         controls_layout.addWidget(self.skip_back_btn)
         controls_layout.addWidget(self.prev_btn)
         controls_layout.addWidget(self.play_btn)
@@ -95,6 +112,8 @@ class PlayerControls(QWidget):
         controls_layout.addWidget(self.stop_btn)
         controls_layout.addWidget(self.next_btn)
         controls_layout.addWidget(self.skip_forward_btn)
+        controls_layout.addWidget(self.shuffle_btn)
+        controls_layout.addWidget(self.repeat_btn)
         
         layout.addLayout(controls_layout)
         
@@ -123,6 +142,15 @@ class PlayerControls(QWidget):
         """Skip forward 10 seconds"""
         self.positionChanged.emit(-20)  # Special value for skip forward
     
+    def _cycle_repeat(self):
+        """Step the repeat mode: off, all, one, off"""
+        modes = ('off', 'all', 'one')
+        self.repeat_mode = modes[(modes.index(self.repeat_mode) + 1) % len(modes)]
+        self.repeat_btn.setChecked(self.repeat_mode != 'off')
+        self.repeat_btn.setText("🔂" if self.repeat_mode == 'one' else "🔁")
+        self.repeat_btn.setToolTip(f"Repeat: {self.repeat_mode}")
+        self.repeatChanged.emit(self.repeat_mode)
+    
     def _on_slider_moved(self, value):
         """Handle slider movement (for visual feedback)"""
         percentage = value / 1000.0
@@ -5,6 +5,7 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
+from ui.async_database import AsyncDatabase
 
 class PlaylistWidget(QWidget):
     songSelected = pyqtSignal(int)  # song_id
@@ -13,9 +14,10 @@ class PlaylistWidget(QWidget):
     playlistRenamed = pyqtSignal(int, str)  # playlist_id, new_name
     playlistDeleted = pyqtSignal(int)  # playlist_id
     
-    def __init__(self, database, parent=None):
+    def __init__(self, database, parent=None, async_db=None):
         super().__init__(parent)
         self.db = database
+        self.async_db = async_db or AsyncDatabase(database, self)
         self.current_playlist_id = None
         self.init_ui()
         self.load_playlists()
@@ -77,8 +79,11 @@ class PlaylistWidget(QWidget):
     
     def load_playlists(self):
         """Load all playlists from database"""
+        self.async_db.submit('playlists', 'get_playlists', callback=self._show_playlists)
+    
+    def _show_playlists(self, playlists):
+        """Fill the playlist list with fetched playlists"""
         self.playlist_list.clear()
-        playlists = self.db.get_playlists()
         
         for playlist in playlists:
             item = QListWidgetItem(f"{playlist['name']} ({playlist['song_count']})")
@@ -108,8 +113,14 @@ class PlaylistWidget(QWidget):
     
     def load_playlist_songs(self, playlist_id):
         """Load songs for selected playlist"""
+        self.async_db.submit(
+            'playlist_songs', 'get_playlist_songs', playlist_id,
+            callback=self._show_playlist_songs
+        )
+    
+    def _show_playlist_songs(self, songs):
+        """Fill the songs list with a fetched playlist"""
         self.songs_list.clear()
-        songs = self.db.get_playlist_songs(playlist_id)
         
         for song in songs:
             duration = self._format_duration(song['duration'])
@@ -205,6 +216,7 @@ class PlaylistWidget(QWidget):
             return
         
         self.db.remove_song_from_playlist(self.current_playlist_id, song_id)
+        self.removeFromPlaylist.emit(self.current_playlist_id, song_id)
         self.load_playlist_songs(self.current_playlist_id)
         
         # Update playlist count